@@ -5,12 +5,17 @@ import pandas as pd
 import numpy as np
 import math
 import os.path
-import calendar
+
+from instrumentation import instrument, write_report
+from transaction_db import save_df_to_db
+from transaction_arrays import update_arrays, load_arrays, monthly_summaries_from_arrays
 
 
 DATA_FILE_DIR = "./data/"
 DATAFILENAME = "all_data"
 OUTPUTFILESSTORE = "./output_files/"
+# The yearly transactions, shared by analyse and the watch mode
+ANNUALSUMMARIESSTORE = OUTPUTFILESSTORE + "annual_summaries/"
 
 
 def import_csv_to_df(location, filename):
@@ -41,6 +46,7 @@ def what_years_in_data(df):
     return df['year'].unique().tolist()
 
 
+@instrument
 def breakdown_into_years(dataframe, unique_years):
     '''
     Breakdown the categorised transactions into years and then write those yearly transactions to spreadsheets
@@ -55,13 +61,16 @@ def breakdown_into_years(dataframe, unique_years):
     # transactions, and save the results to XL
     for i in unique_years:
         temp_df = dataframe[dataframe['year'] == i]
-        # Name for storing this dataframe into XL
-        file_store_name = OUTPUTFILESSTORE + str(i) + '.csv'
+        temp_df['date'] = pd.to_datetime(temp_df['date'])
+        # Name for storing this dataframe (the annual summary that
+        # save_out_dict_of_dfs writes out)
+        file_store_name = ANNUALSUMMARIESSTORE + str(i) + '_annual_summary.csv'
         # Check whether a file already exists for the date, if it does, read it into a dataframe
         if os.path.exists(file_store_name) == True:
             # Read in existing data and then append it to temp_df
-            existing_data_dataframe = import_csv_to_df(OUTPUTFILESSTORE, str(i))
-            temp_df = temp_df.append(existing_data_dataframe)
+            existing_data_dataframe = import_csv_to_df(ANNUALSUMMARIESSTORE, str(i) + '_annual_summary')
+            existing_data_dataframe['date'] = pd.to_datetime(existing_data_dataframe['date'])
+            temp_df = pd.concat([temp_df, existing_data_dataframe])
         # It's possible to accidentally process the same set of transactions, so to prevent
         # duplication, remove any duplicates by finding those with identical 'description'
         # and 'balance'
@@ -73,62 +82,6 @@ def breakdown_into_years(dataframe, unique_years):
     return annual_dfs
 
 
-def monthly_summaries(dataframe, unique_years):
-    '''
-    Takes the classified dataframe and separates it into years and then months to provide summaries of spend on each classification per month. Write summaries to .xslx files
-    :params: A dataframe containing classified transactions, and a list of years that have been affected in the previous classification step (i.e. breakdown_into_years function)
-    :return: Nowt
-    '''
-
-    # Initialise dict for storage
-    monthly_dfs = {}
-
-    # Drop NaNs from the classification column, because it's pointless trying to
-    # summarise unclassified transactions
-    # Drop the rows with 'ignore' classification (because they're meant to be ignored...)
-    dataframe.dropna(subset = ['classification'], inplace = True)
-    dataframe = dataframe[dataframe['classification'] != 'ignore']
-
-    # Go through only the years that were updated in 'breakdown_into_years'
-    # (pointless doing the others, cos they haven't changed)
-    for year in unique_years:
-        # Create new df based on only the current year, get a list
-        # of the unique classifications from it, sort alphabetically
-        # for prettiness reasons
-        current_year_df = dataframe[dataframe['year'] == year]
-        classifications_list = current_year_df['classification'].unique().tolist()
-        classifications_list.sort()
-        # Get unique months from dataframe, sort numerically so that
-        # everything's in order
-        unique_months = current_year_df['month'].unique().tolist()
-        unique_months.sort()
-        # Create empty summary df
-        monthly_summary_df = pd.DataFrame(columns=classifications_list)
-        # Add a month col to later on become the df index. Note that the second
-        #number in 'range' is the number to generate up to, but not include.
-        # That's why to get 1-12 you need to enter 1-13 rather than 1-12. Weird.
-        monthly_summary_df['month'] = range(1,13)
-        # Convert integers in 'month' to a named month
-        monthly_summary_df['month name'] = monthly_summary_df['month'].apply(lambda x: calendar.month_name[x])
-        # Set month no. as index
-        monthly_summary_df.set_index('month', inplace = True)
-        # Go through each month and calculate the transactions
-        for month_count in unique_months:
-            current_month_df = current_year_df[current_year_df['month'] == month_count]
-            # Go through each transaction for the month in question
-            for i in classifications_list:
-                # Sum all money for each month and each classification
-                # Income is the only classification that requires the 'money in' column to be summed
-                if i == 'income':
-                    monthly_summary_df[i].loc[[month_count]] = current_month_df.loc[current_month_df['classification']== i,'money in'].sum()
-                else:
-                    monthly_summary_df[i].loc[[month_count]] = current_month_df.loc[current_month_df['classification']== i,'money out'].sum()
-        # Store the result to csv
-        monthly_dfs[year] = monthly_summary_df
-
-    return monthly_dfs
-
-
 def save_out_dict_of_dfs(dict_dfs, added_text, subfolder):
 
     '''
@@ -141,6 +94,7 @@ def save_out_dict_of_dfs(dict_dfs, added_text, subfolder):
     return
 
 
+@instrument
 def create_monthly_breakdown_all_years(monthly_dfs):
 
     # Get list of years from the monthly breakdowns
@@ -174,6 +128,9 @@ def main():
 
     # Read in data
     df = import_csv_to_df(DATA_FILE_DIR, DATAFILENAME)
+    if len(df) == 0:
+        print('No transactions in ' + DATA_FILE_DIR + DATAFILENAME + '.csv, run the ingest first')
+        return
     
     # Get unique list of years in df
     unique_years = what_years_in_data(df)
@@ -181,8 +138,15 @@ def main():
     # Create spreadsheets of transactions by year
     annual_dfs = breakdown_into_years(df, unique_years)
 
-    # Create monthly summaries and save them
-    monthly_dfs = monthly_summaries(df, unique_years)
+    # The yearly data includes everything from earlier runs, so put it into
+    # the database too (anything already in there is just updated)
+    for year in annual_dfs:
+        save_df_to_db(annual_dfs[year])
+
+    # Update the array store with the years that have changed, then create
+    # the monthly summaries from it (each year is just a slice of the arrays)
+    update_arrays(annual_dfs)
+    monthly_dfs = monthly_summaries_from_arrays(load_arrays(), unique_years)
     
     # Save out dict of dfs to csvs
     save_out_dict_of_dfs(annual_dfs, 'annual_summary', 'annual_summaries')
@@ -190,5 +154,8 @@ def main():
 
     all_years_by_month_df = create_monthly_breakdown_all_years(monthly_dfs)
 
+    # Save timings etc. if instrumentation has been switched on
+    write_report('analyse_budget')
+
 if __name__ == '__main__':
     main()
@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+import subprocess
+import sys
+import json
+import statistics
+
+REPEATS = 5
+HEAVY_MODULES = ['pandas', 'numpy', 'matplotlib', 'matplotlib.pyplot']
+
+# Each of these is run in a brand new interpreter, because once something is
+# imported it's cached and the second import costs nothing
+IMPORT_PATHS = {
+    'cli (no subcommand)': 'import run_budget_planner; run_budget_planner.create_parser()',
+    'ingest / reclassify': 'import collect_and_classify',
+    'analyse': 'import analyse_budget',
+    'plot (no render)': 'import plot_budget',
+    'plot (render)': 'import plot_budget; plot_budget.get_pyplot()',
+}
+
+TIMING_SNIPPET = '''
+import sys, time, json
+start = time.perf_counter()
+{statement}
+elapsed = time.perf_counter() - start
+print(json.dumps({{'seconds': elapsed, 'loaded': [m for m in {heavy!r} if m in sys.modules]}}))
+'''
+
+
+def time_import(statement):
+    '''
+    Time an import path in a fresh python process
+    :params: the python statement to time
+    :return: a dict of the time taken and which heavy modules got pulled in
+    '''
+
+    code = TIMING_SNIPPET.format(statement=statement, heavy=HEAVY_MODULES)
+    output = subprocess.check_output([sys.executable, '-c', code], stderr=subprocess.DEVNULL)
+    return json.loads(output.decode('utf-8').strip().splitlines()[-1])
+
+
+def main():
+    """
+    Main function to run program
+    """
+
+    for name, statement in IMPORT_PATHS.items():
+        try:
+            results = [time_import(statement) for _ in range(REPEATS)]
+        except subprocess.CalledProcessError:
+            print('{:<22} failed (missing dependency?)'.format(name))
+            continue
+        median_ms = statistics.median(result['seconds'] for result in results) * 1000
+        loaded = ', '.join(results[0]['loaded']) or 'nothing heavy'
+        print('{:<22} {:>8.1f} ms   loads: {}'.format(name, median_ms, loaded))
+
+if __name__ == '__main__':
+    main()
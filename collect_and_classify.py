@@ -8,6 +8,8 @@ import os.path
 
 from pandas import ExcelWriter
 from lookup import trans_dict_lookup
+from instrumentation import instrument, write_report
+from transaction_db import save_df_to_db, find_existing_keys, find_last_balances, find_unmatched_transfers
 
 HOME_DIR = "./"
 DATA_FILE_DIR = "./data/"
@@ -15,6 +17,8 @@ UNPROCESSED_STATEMENTS = "./data/unprocessed_statements/"
 ARCHIVED_STATEMENTS = "./data/archived_statements/"
 TRANSACTIONTYPES = "transaction_types"
 OUTPUTFILESSTORE = "./output_files/"
+TRANSFER_TOLERANCE_DAYS = 3
+TRANSFER_TRANS_TYPES = ['inter account transfers']
 
 
 def import_xls_to_df(filename,want_header):
@@ -23,7 +27,7 @@ def import_xls_to_df(filename,want_header):
     :params: get an xls file and a want_header string that's either None or 
     :return: a df
     """
-    return pd.read_excel(filename,sheetname = 'Sheet1', header=want_header)
+    return pd.read_excel(filename,sheet_name = 'Sheet1', header=want_header)
 
 
 def import_csv_to_df(location, filename):
@@ -46,11 +50,14 @@ def export_to_csv(df, location, filename, index_write):
     return df.to_csv(location + filename + '.csv', index=index_write)
 
 
-def find_bank_statements():
+@instrument
+def find_bank_statements(filenames=None):
 
     '''
     Search for bank statements that haven't been processed, read them
     clean them and add them to a dataframe
+    :params: a list of statement filenames in the unprocessed statements dir
+             to read, or None to read every .xlsx file in there
     '''
 
     def clean_santanders_crap(dataframe):
@@ -92,11 +99,12 @@ def find_bank_statements():
 
         # Add new cols for account name, user classification of expenditure, vendor, short description and keyword
         dataframe["account name"] = account_name
-        dataframe["short description"] = np.nan
-        dataframe["vendor"] = np.nan
-        dataframe["trans type"] = np.nan
-        dataframe["classification"] = np.nan
-        dataframe["keyword"] = np.nan
+        # (None rather than NaN, so the cols hold text and not floats)
+        dataframe["short description"] = None
+        dataframe["vendor"] = None
+        dataframe["trans type"] = None
+        dataframe["classification"] = None
+        dataframe["keyword"] = None
 
         # Add date column with year only, and one for month only
         dataframe['year'] = dataframe['date'].dt.year 
@@ -117,8 +125,10 @@ def find_bank_statements():
         
 
     # Start looking for unprocessed bank statements
+    if filenames is None:
+        filenames = os.listdir(UNPROCESSED_STATEMENTS)
     new = 'yes'
-    for file in os.listdir(UNPROCESSED_STATEMENTS):
+    for file in filenames:
         if file.endswith('.xlsx'):
             #Need this if loop because the first iternation has to be a straight read rather than an append
             if new == 'yes':
@@ -132,7 +142,7 @@ def find_bank_statements():
                 temp_df = import_xls_to_df(UNPROCESSED_STATEMENTS + str(file), None)
                 # Clean up the crappy organisation of Santander's data
                 temp_df = clean_santanders_crap(temp_df)
-                dataframe = dataframe.append(temp_df)
+                dataframe = pd.concat([dataframe, temp_df])
     # Re-index data frame because the appending multiple dataframes creates a new dataframe with multiple rows that share the same index numbe
     dataframe.reset_index(drop = True, inplace = True)
 #           Turn this back on to move files once read
@@ -141,6 +151,194 @@ def find_bank_statements():
     return dataframe
     
     
+@instrument
+def validate_balances(dataframe, previous_balances=None, stored_keys=None):
+    '''
+    Check that the running balances reconcile, i.e. that every transaction
+    starts from where an earlier one in the same account finished (balance
+    before = balance - money in + money out). Done as one pass over the whole
+    df rather than walking through the rows, and doesn't care what order the
+    statements were read in
+    :params: a clean dataframe of transactions from one or more accounts, and
+             optionally a df of the balances (account name, date, balance)
+             that the statements read before finished on, and the keys of
+             the transactions already stored (see find_stored_keys)
+    :return: a df with a row per problem: the account, whether it's a 'gap'
+             (missing statement) or an 'overlap' (the same period read twice),
+             the dates it covers and the number of transactions involved
+    '''
+
+    check_df = dataframe[['account name', 'date', 'description', 'money in', 'money out', 'balance']].copy()
+    check_df['date'] = pd.to_datetime(check_df['date'])
+
+    # Work in whole pence so that floating point doesn't get in the way
+    money_in = np.round(check_df['money in'].fillna(0).values * 100).astype(np.int64)
+    money_out = np.round(check_df['money out'].fillna(0).values * 100).astype(np.int64)
+    check_df['closing'] = np.round(check_df['balance'].fillna(0).values * 100).astype(np.int64)
+    check_df['opening'] = check_df['closing'] - money_in + money_out
+
+    # Overlaps: exactly the same transaction more than once means the same
+    # period has been read from two statements, and one that's already
+    # stored means a statement that was read before has been read again
+    duplicated = check_df.duplicated(subset=['account name', 'date', 'description', 'opening', 'closing'])
+    if stored_keys is None:
+        stored_keys = []
+    already_stored = row_keys(check_df).isin(stored_keys)
+    overlaps = check_df[duplicated.values | already_stored].groupby('account name')['date'].agg(['min', 'max', 'count']).reset_index()
+    overlaps.columns = ['account name', 'from', 'to', 'rows']
+    overlaps['problem'] = 'overlap'
+
+    # Where the statements read before finished, so a gap between the last
+    # batch and this one shows up too
+    if previous_balances is None:
+        previous_balances = pd.DataFrame(columns=['account name', 'date', 'balance'])
+    seed_df = pd.DataFrame({'account name': previous_balances['account name'].values,
+                            'date': pd.to_datetime(previous_balances['date']).values,
+                            'closing': np.round(previous_balances['balance'].astype(float).values * 100).astype(np.int64)})
+
+    # Gaps: a transaction whose opening balance isn't the closing balance of
+    # any other transaction in the account means something's missing before it.
+    # The earliest day for an account has nothing before it to check against,
+    # so skip that unless there's a previous balance for the account. Rows
+    # read before still count, the next statement carries on from them
+    check_df = check_df[~duplicated]
+    all_closings = pd.concat([check_df[['account name', 'closing']], seed_df[['account name', 'closing']]])
+    closings = pd.MultiIndex.from_arrays([all_closings['account name'], all_closings['closing']])
+    openings = pd.MultiIndex.from_arrays([check_df['account name'], check_df['opening']])
+    reconciled = openings.isin(closings)
+    first_dates = check_df.groupby('account name')['date'].transform('min')
+    checkable = (check_df['date'] > first_dates) | check_df['account name'].isin(seed_df['account name'])
+    breaks = check_df[~reconciled & checkable.values]
+
+    # The gap runs from the last day there were transactions before the break
+    dates_df = pd.concat([check_df[['account name', 'date']], seed_df[['account name', 'date']]])
+    dates_df = dates_df.drop_duplicates().sort_values(['account name', 'date'])
+    dates_df['from'] = dates_df.groupby('account name')['date'].shift()
+    breaks = breaks.merge(dates_df, on=['account name', 'date'], how='left')
+    gaps = breaks.groupby(['account name', 'from', 'date']).size().reset_index()
+    gaps.columns = ['account name', 'from', 'to', 'rows']
+    gaps['problem'] = 'gap'
+
+    problems_df = pd.concat([gaps, overlaps], ignore_index=True)
+    problems_df = problems_df[['account name', 'problem', 'from', 'to', 'rows']]
+    problems_df.sort_values(by=['account name', 'from'], inplace=True)
+
+    return problems_df
+
+
+def row_keys(dataframe):
+
+    '''
+    The account, description and balance of each transaction, which is what
+    marks two transactions as the same one
+    '''
+    return pd.MultiIndex.from_arrays([dataframe['account name'], dataframe['description'], dataframe['balance'].round(2)])
+
+
+def find_stored_keys(dataframe):
+    '''
+    Get the keys (see row_keys) of the transactions already in the database,
+    only asking about the accounts and dates that a batch covers
+    :params: a clean dataframe of transactions
+    :return: a list of (account name, description, balance) tuples
+    '''
+
+    if len(dataframe) == 0:
+        return []
+
+    dates = pd.to_datetime(dataframe['date'])
+    existing_keys = find_existing_keys(dates.min().strftime('%Y-%m-%d'), dates.max().strftime('%Y-%m-%d'),
+                                       dataframe['account name'].unique().tolist())
+
+    return [(account, description, round(balance, 2)) for account, description, balance in existing_keys]
+
+
+def check_balances(dataframe, stored_keys=None):
+
+    '''
+    Run validate_balances, carrying on from the balances already in the
+    database, and tell the user about any problems
+    '''
+    if stored_keys is None:
+        stored_keys = find_stored_keys(dataframe)
+
+    first_dates = pd.to_datetime(dataframe['date']).groupby(dataframe['account name']).min()
+    previous_balances = find_last_balances({account: date.strftime('%Y-%m-%d') for account, date in first_dates.items()})
+    previous_balances_df = pd.DataFrame(previous_balances, columns=['account name', 'date', 'balance'])
+
+    problems_df = validate_balances(dataframe, previous_balances_df, stored_keys)
+    if len(problems_df) > 0:
+        export_to_csv(problems_df, DATA_FILE_DIR, 'balance_problems', False)
+        print(str(len(problems_df)) + ' balance problems (missing or repeated statements), see ' + DATA_FILE_DIR + 'balance_problems.csv')
+    elif os.path.exists(DATA_FILE_DIR + 'balance_problems.csv'):
+        # Don't leave the problems from an earlier run lying around
+        os.remove(DATA_FILE_DIR + 'balance_problems.csv')
+
+    return problems_df
+
+
+@instrument
+def drop_overlapping_rows(dataframe, stored_keys=None):
+    '''
+    Get rid of transactions that have been read before, either because two
+    statements in this batch cover the same period or because they're already
+    in the database. That way only the new transactions get classified
+    :params: a clean dataframe of transactions, and the keys of the ones
+             already stored (looked up if not given, see find_stored_keys)
+    :return: a dataframe without the transactions that have been seen before
+    '''
+
+    # Same key as breakdown_into_years uses (plus the account)
+    dataframe = dataframe.drop_duplicates(subset=['account name', 'description', 'balance'])
+
+    if stored_keys is None:
+        stored_keys = find_stored_keys(dataframe)
+    if len(stored_keys) > 0:
+        dataframe = dataframe[~row_keys(dataframe).isin(stored_keys)]
+
+    dataframe.reset_index(drop=True, inplace=True)
+
+    return dataframe
+
+
+@instrument
+def add_to_all_data(dataframe, rematched_df=None):
+    '''
+    Add new transactions to the end of all_data.csv, so that reclassify,
+    analyse and plot still see the whole history and not just the latest
+    statements. The file only gets read and written in full when transactions
+    that were already in there have been matched up with a transfer since
+    :params: a dataframe of new, classified transactions, and a dataframe of
+             earlier transactions that now have a transfer id
+    :return: nothing, saves all_data.csv
+    '''
+
+    filename = DATA_FILE_DIR + 'all_data.csv'
+    if not os.path.exists(filename):
+        export_to_csv(dataframe, DATA_FILE_DIR, 'all_data', False)
+        return
+
+    columns = pd.read_csv(filename, nrows=0).columns
+    rematched = rematched_df is not None and len(rematched_df) > 0
+    if not rematched and set(dataframe.columns) <= set(columns):
+        dataframe.reindex(columns=columns).to_csv(filename, mode='a', header=False, index=False)
+        return
+
+    all_df = import_csv_to_df(DATA_FILE_DIR, 'all_data')
+    if rematched:
+        transfer_ids = pd.Series(rematched_df['transfer id'].values, index=row_keys(rematched_df))
+        transfer_ids = transfer_ids[~transfer_ids.index.duplicated()]
+        new_ids = transfer_ids.reindex(row_keys(all_df)).values
+        if 'transfer id' in all_df.columns:
+            new_ids = np.where(pd.isnull(new_ids), all_df['transfer id'].values, new_ids)
+        all_df['transfer id'] = new_ids
+    all_df = pd.concat([all_df, dataframe], ignore_index=True)
+    export_to_csv(all_df, DATA_FILE_DIR, 'all_data', False)
+
+    return
+
+
+@instrument
 def split_out_data(dataframe):
     """
     Takes a dataframe. Splits the 'description' col by commas and puts
@@ -160,6 +358,7 @@ def split_out_data(dataframe):
     return dataframe
 
 
+@instrument
 def create_trans_types(dataframe):
     '''
     Takes the first word of the 'short description' and uses it to
@@ -185,6 +384,91 @@ def create_trans_types(dataframe):
     return dataframe
 
 
+@instrument
+def match_transfers(dataframe, tolerance_days=TRANSFER_TOLERANCE_DAYS):
+    '''
+    Pair up money going out of one of our accounts with the same amount coming
+    into another one of our accounts within a few days. Both legs get the same
+    'transfer id' so that they can be left out of the summaries, otherwise a
+    transfer counts as both income and outgoings. Anything that's already
+    been matched keeps its id, so this can be run over everything collected
+    to pair up new legs with ones from earlier statements
+    :params: a dataframe with trans types, and how many days apart the two
+             legs of a transfer can be
+    :return: a dataframe with a 'transfer id' col (NaN for anything that isn't a matched transfer)
+    '''
+
+    if 'transfer id' not in dataframe.columns:
+        dataframe['transfer id'] = np.nan
+    dataframe['transfer id'] = dataframe['transfer id'].astype(object)
+
+    # Only look at the kinds of transactions that a transfer could show up as,
+    # and that haven't been matched already
+    candidates = dataframe[dataframe['trans type'].isin(TRANSFER_TRANS_TYPES) & dataframe['transfer id'].isnull()]
+    dates = pd.to_datetime(candidates['date'])
+
+    # Work in whole pence so the amounts can be matched exactly
+    money_out = candidates['money out'].fillna(0)
+    money_in = candidates['money in'].fillna(0)
+    is_out = (money_out > 0).values
+    is_in = (money_in > 0).values
+
+    out_df = pd.DataFrame({'out row': candidates.index[is_out],
+                           'date': dates.values[is_out],
+                           'pence': np.round(money_out.values[is_out] * 100).astype(np.int64),
+                           'out account': candidates['account name'].values[is_out],
+                           'out balance': candidates['balance'].values[is_out]})
+    in_df = pd.DataFrame({'in row': candidates.index[is_in],
+                          'date': dates.values[is_in],
+                          'pence': np.round(money_in.values[is_in] * 100).astype(np.int64),
+                          'in account': candidates['account name'].values[is_in],
+                          'in balance': candidates['balance'].values[is_in]})
+    # merge_asof eats the right hand date, and we need it to find the closest match
+    in_df['in date'] = in_df['date']
+
+    tolerance = pd.Timedelta(days=tolerance_days)
+    matched_dfs = []
+
+    # There's only a handful of accounts, so go through each way money can move
+    # between them and match all the transfers for that direction in one go
+    for out_account in out_df['out account'].unique():
+        for in_account in in_df['in account'].unique():
+            if out_account == in_account:
+                continue
+            outs = out_df[out_df['out account'] == out_account].sort_values('date')
+            ins = in_df[in_df['in account'] == in_account].sort_values('date')
+            # Two outgoings for the same amount can both be closest to the same
+            # incoming, so match, keep the closest of those, take the matched
+            # rows out and go again until nothing else matches
+            while len(outs) > 0 and len(ins) > 0:
+                matched = pd.merge_asof(outs, ins, on='date', by='pence', tolerance=tolerance, direction='nearest')
+                matched = matched.dropna(subset=['in row'])
+                if len(matched) == 0:
+                    break
+                matched['gap'] = (matched['date'] - matched['in date']).abs()
+                matched = matched.sort_values('gap', kind='mergesort').drop_duplicates('in row')
+                matched['in row'] = matched['in row'].astype(np.int64)
+                matched_dfs.append(matched)
+                outs = outs[~outs['out row'].isin(matched['out row'])]
+                ins = ins[~ins['in row'].isin(matched['in row'])]
+
+    if len(matched_dfs) == 0:
+        return dataframe
+
+    matched = pd.concat(matched_dfs)
+
+    # The balance after a transaction is as near to unique as these statements
+    # get, so use both balances to make an id that won't clash with transfers
+    # matched in other runs
+    transfer_ids = (matched['out account'] + ' ' + matched['out balance'].map('{:.2f}'.format) + ' > ' +
+                    matched['in account'] + ' ' + matched['in balance'].map('{:.2f}'.format))
+    dataframe.loc[matched['out row'].values, 'transfer id'] = transfer_ids.values
+    dataframe.loc[matched['in row'].values, 'transfer id'] = transfer_ids.values
+
+    return dataframe
+
+
+@instrument
 def get_classifications(dataframe, search_col, class_col, keyword_col, trans_df, keyword, classification):
     '''
     Classify the payments in dataframe based on the infomation in the trans_dataframe
@@ -221,6 +505,7 @@ def get_classifications(dataframe, search_col, class_col, keyword_col, trans_df,
     return dataframe
 
 
+@instrument
 def update_trans_df(dataframe, class_col, trans_df):
     '''
     Takes the unclassified transactions and adds them back to transactions_types.xlsx
@@ -234,11 +519,11 @@ def update_trans_df(dataframe, class_col, trans_df):
     # Create a dataframe by taking all the rows without a keyword
     # from the super dataframe. Drop three columns that I don't need
     unclass_df = dataframe[dataframe[class_col].isnull()]
-    unclass_df = unclass_df.drop(['balance','year', 'month'], axis=1)
+    unclass_df = unclass_df.drop(['balance','year', 'month', 'transfer id'], axis=1, errors='ignore')
     
     # Append the unclassified dataframe onto the trans one
     trans_df.dropna(subset = [class_col], inplace=True)
-    trans_df = trans_df.append(unclass_df)
+    trans_df = pd.concat([trans_df, unclass_df])
 
     # Take the resulting dataframe, remove duplicates of vendor,
     # remove all transactions relating to cash withdrawals (which don't
@@ -263,16 +548,56 @@ def update_trans_df(dataframe, class_col, trans_df):
     return
 
 
-def main():
+def reclassify():
     """
-    Main function to run program
+    Re-run the classification over the already collected data in all_data.csv
+    without going back to the bank statements. Useful after adding keywords
+    to transaction_types.csv
     """
     # I write back to the original dataframe and pandas warns about that, so turning off the warning    
     pd.options.mode.chained_assignment = None
 
+    df = import_csv_to_df(DATA_FILE_DIR, 'all_data')
+    df_class = import_csv_to_df(HOME_DIR, TRANSACTIONTYPES)
+
+    # Wipe the old classifications, otherwise get_classifications won't
+    # overwrite them. None rather than NaN keeps them as text cols
+    df['classification'] = None
+    df['keyword'] = None
+
+    df = get_classifications(df, 'short description', 'classification', 'keyword', df_class, 'keyword', 'classification')
+
+    export_to_csv(df, DATA_FILE_DIR, 'all_data', False)
+    save_df_to_db(df)
+    update_trans_df(df, 'classification', df_class)
+
+    # Save timings etc. if instrumentation has been switched on
+    write_report('reclassify')
+
+
+def classify_new_transactions(filenames=None):
+    '''
+    Read, check and classify the bank statements. Only the transactions that
+    haven't been read before get classified. Nothing is saved, that's left
+    to save_new_transactions
+    :params: a list of statement filenames in the unprocessed statements dir
+             to read, or None to read every .xlsx file in there
+    :return: a dataframe of the new transactions (empty if there weren't any),
+             a dataframe of earlier ones that have now been matched up with a
+             transfer, and the transaction types df
+    '''
+
     # Read in statement data
-    df = find_bank_statements()   
-    
+    df = find_bank_statements(filenames)
+
+    # Check the balances add up, and skip anything that's been read before
+    stored_keys = find_stored_keys(df)
+    check_balances(df, stored_keys)
+    df = drop_overlapping_rows(df, stored_keys)
+    if len(df) == 0:
+        print('No new transactions in the statements')
+        return df, df, None
+
     # Import dataframe from transaction type xlsx, 0 reverts header to default action
     df_class = import_csv_to_df(HOME_DIR, TRANSACTIONTYPES)
 
@@ -281,16 +606,82 @@ def main():
     
     # Get transaction types
     df = create_trans_types(df)
-    
+
     # Classify the transactions
     df = get_classifications(df, 'short description', 'classification', 'keyword', df_class, 'keyword', 'classification')
 
-    # Save super dataframe with all info into 
-    
-    export_to_csv(df, DATA_FILE_DIR, 'all_data', False)
+    # Pair up the two sides of transfers between our own accounts. The other
+    # leg of a new transfer can be in a statement that was read before, so
+    # the stored legs that haven't been matched yet go in too
+    dates = pd.to_datetime(df['date'])
+    tolerance = pd.Timedelta(days=TRANSFER_TOLERANCE_DAYS)
+    stored_legs_df = find_unmatched_transfers((dates.min() - tolerance).strftime('%Y-%m-%d'),
+                                              (dates.max() + tolerance).strftime('%Y-%m-%d'), TRANSFER_TRANS_TYPES)
+    number_of_new_rows = len(df)
+    if len(stored_legs_df) > 0:
+        df = pd.concat([df, stored_legs_df], ignore_index=True)
+    df = match_transfers(df)
+    rematched_df = df.iloc[number_of_new_rows:]
+    rematched_df = rematched_df[rematched_df['transfer id'].notnull()]
+    df = df.iloc[:number_of_new_rows]
+
+    return df, rematched_df, df_class
+
+
+def save_new_transactions(df, rematched_df, df_class):
+    '''
+    Add the transactions from classify_new_transactions to all_data.csv and
+    the database. Once they're in the database they count as read, so
+    anything that has to happen before then (like the watch mode updating
+    the yearly store) should be done first
+    :params: the three things classify_new_transactions returns
+    :return: nothing, saves the transactions
+    '''
+
+    # Add the new transactions to the super dataframe with all info in
+    add_to_all_data(df, rematched_df)
+
+    # ...and into the database for querying
+    save_df_to_db(df)
+    save_df_to_db(rematched_df)
 
     # Update transaction dataframe
     update_trans_df(df, 'classification', df_class)    
 
+    return
+
+
+def ingest(filenames=None):
+    '''
+    Read, check and classify the bank statements, then add the new
+    transactions to all_data.csv and the database
+    :params: a list of statement filenames in the unprocessed statements dir
+             to read, or None to read every .xlsx file in there
+    :return: a dataframe of the new transactions, plus any earlier ones that
+             have now been matched up with a transfer (empty if there weren't any)
+    '''
+
+    df, rematched_df, df_class = classify_new_transactions(filenames)
+    if len(df) == 0:
+        return df
+
+    save_new_transactions(df, rematched_df, df_class)
+
+    # The new transactions, and the earlier ones that have just been matched
+    return pd.concat([df, rematched_df], ignore_index=True)
+
+
+def main():
+    """
+    Main function to run program
+    """
+    # I write back to the original dataframe and pandas warns about that, so turning off the warning    
+    pd.options.mode.chained_assignment = None
+
+    ingest()
+
+    # Save timings etc. if instrumentation has been switched on
+    write_report('collect_and_classify')
+
 if __name__ == '__main__':
     main()
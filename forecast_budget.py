@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+import pandas as pd
+import numpy as np
+import os.path
+
+from instrumentation import instrument, write_report
+
+
+ANNUALSUMMARIESSTORE = "./output_files/annual_summaries/"
+FORECASTSTORE = "./output_files/forecasts/"
+HISTORY_MONTHS = 12
+DAYS_IN_PROFILE = 32
+
+
+def import_csv_to_df(location, filename):
+    """
+    Imports a csv file into a Pandas dataframe
+    :params: an xls file and a sheetname from that file
+    :return: a df
+    """
+
+    return pd.read_csv(location + filename + '.csv')
+
+
+def export_to_csv(df, location, filename, index_write):
+    """
+    Exports a df to a csv file
+    :params: a df and a location in which to save it
+    :return: nothing, saves a csv
+    """
+
+    return df.to_csv(location + filename + '.csv', index=index_write)
+
+
+@instrument
+def load_history(as_of=None, months=HISTORY_MONTHS):
+    '''
+    Read in the yearly transactions that analyse_budget saved, going back far
+    enough to cover the history the forecast needs
+    :params: the date to forecast from (None means the latest saved year) and
+             how many months of history to use
+    :return: a df of transactions
+    '''
+
+    # Which years have been saved
+    saved_years = []
+    if os.path.exists(ANNUALSUMMARIESSTORE):
+        for file in os.listdir(ANNUALSUMMARIESSTORE):
+            if file.endswith('_annual_summary.csv') and file[:4].isdigit():
+                saved_years.append(int(file[:4]))
+
+    # Without a date, forecast from whatever the latest saved year is
+    if as_of is None:
+        last_year = max(saved_years) if len(saved_years) > 0 else pd.Timestamp.today().year
+        first_year = last_year - months // 12 - 1
+    else:
+        as_of = pd.Timestamp(as_of)
+        last_year = as_of.year
+        first_year = (as_of - pd.DateOffset(months=months)).year
+
+    year_dfs = []
+    for year in sorted(saved_years):
+        if first_year <= year <= last_year:
+            year_dfs.append(import_csv_to_df(ANNUALSUMMARIESSTORE, str(year) + '_annual_summary'))
+
+    if len(year_dfs) == 0:
+        raise ValueError('No annual summaries in ' + ANNUALSUMMARIESSTORE + ' from ' + str(first_year) + ', run analyse_budget first')
+
+    history_df = pd.concat(year_dfs, ignore_index=True)
+    history_df['date'] = pd.to_datetime(history_df['date'])
+
+    return history_df
+
+
+def sum_by_group_and_day(codes, days, amounts, number_of_groups):
+    '''
+    Total up amounts into a grid of (account, classification) group by day of
+    the month, all in one go
+    :params: arrays of group codes, days of the month and amounts, and the number of groups
+    :return: a number_of_groups x DAYS_IN_PROFILE array of totals (col 0 is never used)
+    '''
+
+    totals = np.bincount(codes * DAYS_IN_PROFILE + days, weights=amounts,
+                         minlength=number_of_groups * DAYS_IN_PROFILE)
+
+    return totals.reshape(number_of_groups, DAYS_IN_PROFILE)
+
+
+@instrument
+def forecast_month_end(transactions_df, as_of=None, months=HISTORY_MONTHS):
+    '''
+    This is what calculate_daily_spend was heading towards: on, say, day 25,
+    how much of this month's money is still to go out (and come in)?
+    For every account and classification, the previous months give the usual
+    monthly total and how much of it has normally gone by each day of the
+    month. The part of the usual total that normally comes after today is
+    what's still to come, and that gets added onto each account's latest
+    balance to give the month end balance
+    :params: a df of transactions (with account name, classification, date,
+             money in, money out and balance), the date to forecast from
+             (None means the latest transaction) and how many months of history to use
+    :return: a df of the forecast for each account and classification, and a
+             df of the forecast month end balance for each account
+    '''
+
+    transactions_df = transactions_df.copy()
+    transactions_df['date'] = pd.to_datetime(transactions_df['date'])
+    if as_of is None:
+        as_of = transactions_df['date'].max()
+    as_of = pd.Timestamp(as_of)
+    month_start = as_of.replace(day=1)
+    history_start = month_start - pd.DateOffset(months=months)
+
+    # Unclassified transactions still move money, so they stay in (unlike
+    # the summaries) under their own name
+    transactions_df['classification'] = transactions_df['classification'].fillna('unclassified')
+    transactions_df = transactions_df[(transactions_df['date'] >= history_start) & (transactions_df['date'] <= as_of)]
+
+    # Give every account and classification pair a number, so everything
+    # after this can be done with arrays rather than groupbys
+    codes, groups = pd.factorize(pd.MultiIndex.from_arrays([transactions_df['account name'], transactions_df['classification']]))
+    number_of_groups = len(groups)
+    days = transactions_df['date'].dt.day.values
+    money_in = transactions_df['money in'].fillna(0).values.astype(np.float64)
+    money_out = transactions_df['money out'].fillna(0).values.astype(np.float64)
+    in_history = (transactions_df['date'] < month_start).values
+    this_month = ~in_history
+
+    # How many months of history there really are (there might be less than asked for)
+    history_months = transactions_df.loc[in_history, 'date'].dt.to_period('M').nunique()
+    history_months = max(history_months, 1)
+
+    forecast = {}
+    for direction, amounts in [('in', money_in), ('out', money_out)]:
+        history_by_day = sum_by_group_and_day(codes[in_history], days[in_history], amounts[in_history], number_of_groups)
+        monthly_total = history_by_day.sum(axis=1)
+        # The fraction of a usual month's money that has gone by the end of
+        # each day. Groups with no history have nothing still to come
+        gone_by_day = np.cumsum(history_by_day, axis=1) / np.where(monthly_total > 0, monthly_total, 1)[:, np.newaxis]
+        gone_by_day[monthly_total == 0] = 1
+        usual = monthly_total / history_months
+        forecast['usual money ' + direction] = usual
+        forecast['money ' + direction + ' so far'] = np.bincount(codes[this_month], weights=amounts[this_month], minlength=number_of_groups)
+        forecast['money ' + direction + ' to come'] = usual * (1 - gone_by_day[:, as_of.day])
+
+    classification_forecast_df = pd.DataFrame(forecast)
+    classification_forecast_df.insert(0, 'classification', groups.get_level_values(1))
+    classification_forecast_df.insert(0, 'account name', groups.get_level_values(0))
+    classification_forecast_df.sort_values(by=['account name', 'money out to come'], ascending=[True, False], inplace=True)
+
+    # Latest balance for each account (if there are several transactions on
+    # the last day, whichever of them was read in last)
+    latest_df = transactions_df.sort_values(by='date', kind='mergesort').drop_duplicates('account name', keep='last')
+    account_forecast_df = classification_forecast_df.groupby('account name')[['money in to come', 'money out to come']].sum()
+    account_forecast_df['balance'] = latest_df.set_index('account name')['balance']
+    account_forecast_df['balance date'] = latest_df.set_index('account name')['date']
+    account_forecast_df['month end balance'] = (account_forecast_df['balance'] + account_forecast_df['money in to come']
+                                                - account_forecast_df['money out to come'])
+    account_forecast_df.reset_index(inplace=True)
+
+    return classification_forecast_df, account_forecast_df
+
+
+def save_forecasts(classification_forecast_df, account_forecast_df):
+
+    '''
+    Save the forecasts by classification and by account to csvs
+    '''
+    if not os.path.exists(FORECASTSTORE):
+        os.makedirs(FORECASTSTORE)
+    export_to_csv(classification_forecast_df, FORECASTSTORE, 'forecast_by_classification', False)
+    export_to_csv(account_forecast_df, FORECASTSTORE, 'forecast_by_account', False)
+
+    return
+
+
+def main(as_of=None, months=HISTORY_MONTHS):
+    """
+    Main function to run program
+    :params: the date to forecast from (None means the latest transaction)
+             and how many months of history to use
+    """
+
+    history_df = load_history(as_of, months)
+    classification_forecast_df, account_forecast_df = forecast_month_end(history_df, as_of, months)
+    save_forecasts(classification_forecast_df, account_forecast_df)
+
+    print(account_forecast_df[['account name', 'balance', 'money in to come', 'money out to come', 'month end balance']].to_string(index=False))
+
+    # Save timings etc. if instrumentation has been switched on
+    write_report('forecast_budget')
+
+    return account_forecast_df
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,212 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+import os
+import os.path
+import time
+import json
+import datetime
+import functools
+import tracemalloc
+import cProfile
+
+
+PROFILINGSTORE = "./output_files/profiling/"
+
+# Instrumentation is opt-in. Either set BUDGET_PROFILE=1 in the environment
+# or call enable_instrumentation() before running the pipeline. Set
+# BUDGET_PROFILE_STAGE to the name of a function (e.g. monthly_summaries_from_arrays)
+# to also get a cProfile dump of that one stage
+_state = {
+    'enabled': os.environ.get('BUDGET_PROFILE', '') not in ('', '0'),
+    'profile_stage': os.environ.get('BUDGET_PROFILE_STAGE') or None,
+    'records': [],
+    # One entry per instrumented stage that's currently running, innermost
+    # last. See start_memory_tracking
+    'memory stack': [],
+    'started tracing': False,
+}
+
+
+def enable_instrumentation(profile_stage=None):
+    '''
+    Switch on the recording of timings, memory and row counts for every
+    instrumented stage
+    :params: the name of a stage to cProfile, or None for no cProfile dump
+    :return: nothing
+    '''
+
+    _state['enabled'] = True
+    if profile_stage is not None:
+        _state['profile_stage'] = profile_stage
+
+    return
+
+
+def instrumentation_enabled():
+
+    '''
+    Is instrumentation switched on?
+    '''
+    return _state['enabled']
+
+
+def count_rows(obj):
+    '''
+    Count the rows in whatever a stage was given or returned. Handles a single
+    df, the dicts of dfs that get passed around everywhere in this code, and
+    the array store (see transaction_arrays.load_arrays)
+    :params: a df, a dict of dfs, the array store, or anything else
+    :return: number of rows, or None if it's not something with rows
+    '''
+
+    if isinstance(obj, dict):
+        # The array store is a dict of arrays that all have a row per
+        # transaction, so it's as many rows as any one of them
+        if 'offsets' in obj and 'date' in obj:
+            return count_rows(obj['date'])
+        # Otherwise only count what's actually a df (or a dict of them)
+        counts = [count_rows(value) for value in obj.values() if isinstance(value, dict) or hasattr(value, 'iloc')]
+        counts = [count for count in counts if count is not None]
+        if len(counts) == 0:
+            return None
+        return sum(counts)
+    # Anything with a shape (dfs, series, arrays) has rows
+    if hasattr(obj, 'shape') and len(obj.shape) > 0:
+        return int(obj.shape[0])
+
+    return None
+
+
+def start_memory_tracking():
+    '''
+    Start measuring the peak memory of a stage. tracemalloc only has the one
+    peak, and a stage called from inside another stage has to reset it, so
+    the outer stage's peak so far is carried on the stack before that happens
+    :params: nothing
+    :return: nothing
+    '''
+
+    stack = _state['memory stack']
+    if len(stack) == 0:
+        # Only trace while stages are running, it slows everything else down
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _state['started tracing'] = True
+    else:
+        _, peak_so_far = tracemalloc.get_traced_memory()
+        stack[-1]['carried peak'] = max(stack[-1]['carried peak'], peak_so_far)
+
+    memory_before, _ = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+    stack.append({'memory before': memory_before, 'carried peak': 0})
+
+    return
+
+
+def stop_memory_tracking():
+    '''
+    Finish measuring the peak memory of the innermost running stage, and pass
+    its peak on to the stage that called it
+    :params: nothing
+    :return: the peak memory of the stage in bytes, above what was in use when it started
+    '''
+
+    stack = _state['memory stack']
+    _, peak = tracemalloc.get_traced_memory()
+    frame = stack.pop()
+    peak = max(peak, frame['carried peak'])
+
+    if len(stack) > 0:
+        stack[-1]['carried peak'] = max(stack[-1]['carried peak'], peak)
+    elif _state['started tracing']:
+        tracemalloc.stop()
+        _state['started tracing'] = False
+
+    return max(peak - frame['memory before'], 0)
+
+
+def instrument(func):
+    '''
+    Decorator that records wall time, CPU time, peak memory and row counts
+    for a pipeline stage. Does nothing but call the function when
+    instrumentation is switched off
+    :params: a pipeline function
+    :return: the wrapped function
+    '''
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not _state['enabled']:
+            return func(*args, **kwargs)
+
+        # Rows in have to be counted before the call, because lots of the
+        # stages drop rows from their input in place
+        rows_in = count_rows(args[0]) if len(args) > 0 else None
+
+        profiler = None
+        if _state['profile_stage'] == func.__name__:
+            profiler = cProfile.Profile()
+
+        start_memory_tracking()
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            if profiler is not None:
+                result = profiler.runcall(func, *args, **kwargs)
+            else:
+                result = func(*args, **kwargs)
+        finally:
+            cpu_time = time.process_time() - cpu_start
+            wall_time = time.perf_counter() - wall_start
+            memory_peak = stop_memory_tracking()
+
+        if profiler is not None:
+            if not os.path.exists(PROFILINGSTORE):
+                os.makedirs(PROFILINGSTORE)
+            profiler.dump_stats(PROFILINGSTORE + func.__name__ + '.prof')
+
+        _state['records'].append({
+            'stage': func.__name__,
+            'module': func.__module__,
+            'wall time (s)': wall_time,
+            'cpu time (s)': cpu_time,
+            'peak memory (bytes)': memory_peak,
+            'rows in': rows_in,
+            'rows out': count_rows(result),
+        })
+
+        return result
+
+    return wrapper
+
+
+def write_report(run_name):
+    '''
+    Write out everything that's been recorded in this run as json, then
+    clear the records so the next run starts fresh
+    :params: a name for the run (usually the script that ran)
+    :return: the filename written to, or None if instrumentation is off
+    '''
+
+    if not _state['enabled']:
+        return None
+
+    if not os.path.exists(PROFILINGSTORE):
+        os.makedirs(PROFILINGSTORE)
+
+    timestamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
+    filename = PROFILINGSTORE + run_name + '_' + timestamp + '.json'
+
+    report = {
+        'run': run_name,
+        'timestamp': timestamp,
+        'profiled stage': _state['profile_stage'],
+        'stages': _state['records'],
+    }
+    with open(filename, 'w') as report_file:
+        json.dump(report, report_file, indent=2)
+
+    _state['records'] = []
+
+    return filename
@@ -4,7 +4,9 @@
 import pandas as pd
 import numpy as np
 import math
-import matplotlib.pyplot as plt
+
+from instrumentation import instrument, write_report
+from transaction_arrays import arrays_exist, load_arrays, daily_spend_from_arrays
 
 
 DATA_FILE_DIR = "./data/"
@@ -13,6 +15,8 @@ BYMONTHDATA = "all_years_by_month"
 MONTHLIESFILESSTORE = "./output_files/monthly_breakdowns/"
 MONTHLIESPLOTSTORE = "./output_files/monthly_plots/"
 ANNUALSPLOTSTORE = "./output_files/annual_plots/"
+DASHBOARDFILE = "./output_files/budget_dashboard.pdf"
+TOP_N_OUTGOINGS = 10
 
 def import_csv_to_df(location, filename):
     """
@@ -34,6 +38,16 @@ def export_to_csv(df, location, filename, index_write):
     return df.to_csv(location + filename + '.csv', index=index_write)
 
 
+def get_pyplot():
+
+    '''
+    pyplot takes ages to import (and builds the font cache the first time),
+    so only import it when something is actually being drawn
+    '''
+    import matplotlib.pyplot as plt
+    return plt
+
+
 def what_years_in_data(df):
 
     '''
@@ -42,7 +56,8 @@ def what_years_in_data(df):
     return df['year'].unique().tolist()
 
 
-def calculate_daily_spend(all_data_df):
+@instrument
+def calculate_daily_spend(all_data_df, store=None):
     
     '''
     The idea here is to find which days of the month we spend money
@@ -53,8 +68,16 @@ def calculate_daily_spend(all_data_df):
     
     I need to just look at the previous year's worth of data really, because if I average
     over all years, inflation will skew the figures down
+
+    If the array store has been built (by analyse_budget), pass it in as store
+    and the averages come straight from the arrays instead
+
+    Returns a series of the average money out, indexed by day of the month
     '''
 
+    if store is not None:
+        return daily_spend_from_arrays(store)
+
     # Convert the date to a date type, then create a new col with the number
     # of the month in it
     all_data_df['date'] = all_data_df['date'].astype('datetime64[ns]')
@@ -65,12 +88,12 @@ def calculate_daily_spend(all_data_df):
 
     for day in range(1,32):
         temp_df = all_data_df[all_data_df['day']==day]
-        average_daily = temp_df['money out'].mean()
-        print(day)
-        print(average_daily)
-    return
+        daily_spend_df.loc[day, 'money out'] = temp_df['money out'].mean()
+
+    return daily_spend_df['money out']
 
 
+@instrument
 def get_monthly_summaries(unique_years):
 
     # Initialise dict of dfs
@@ -87,6 +110,7 @@ def get_monthly_summaries(unique_years):
     return monthly_dfs
 
 
+@instrument
 def create_incomings(monthly_dfs):
 
     income_dfs = {}
@@ -97,105 +121,243 @@ def create_incomings(monthly_dfs):
     return income_dfs
 
 
-def create_detailed_outgoings(monthly_dfs):
+@instrument
+def rank_outgoings(monthly_dfs, top_n=TOP_N_OUTGOINGS):
 
     '''
-    Create the detailed outgoing dfs by taking the monthly dfs and dropping the income
-    from them, then re-arranging into size order to make later plotting pretty and pretty
-    easy
+    Create the detailed and summary outgoings dfs in one go from the monthly dfs.
+    The detailed dfs have the income dropped and the cols re-arranged into size
+    order to make later plotting pretty and pretty easy. There are too many cols
+    to make sense when the outgoings are graphed, so the summary dfs keep the
+    biggest top_n of them and combine the remaining ones into an "other" column.
+    The monthly dfs are not changed
+    :params: a dict of monthly dfs and the number of classifications to keep in the summary
+    :return: a dict of detailed outgoings dfs and a dict of summary outgoings dfs
     '''
 
+    if top_n < 1:
+        raise ValueError('top_n has to be at least 1, not ' + str(top_n))
+
     # Initialise
     outgoings_detail_dfs = {}
-    
+    outgoings_summary_dfs = {}
+
+    # Stack all the years into one df keyed by year. Concatenating makes a new
+    # df, so dropping the income (and anything else that isn't an outgoing)
+    # doesn't touch the monthly dfs
+    all_outgoings_df = pd.concat(monthly_dfs, names=['year', 'month name'])
+    not_outgoings = [col for col in ['income', 'year', 'month'] if col in all_outgoings_df.columns]
+    all_outgoings_df = all_outgoings_df.drop(not_outgoings, axis=1)
+
+    # Each year only has the classifications that were used that year, so keep
+    # track of which ones are really there, then total everything by year
+    present_df = all_outgoings_df.notnull().groupby(level='year').any()
+    totals_df = all_outgoings_df.fillna(0).groupby(level='year').sum()
+
+    # Rank the classifications for every year at once. Ones that aren't used
+    # in a year get -inf so they sink to the bottom and can be chopped off
+    # (mergesort is stable, so ties stay in alphabetical order)
+    classifications = np.array(totals_df.columns)
+    ranking_values = np.where(present_df.values, totals_df.values.astype(np.float64), -np.inf)
+    ranked_positions = np.argsort(-ranking_values, axis=1, kind='mergesort')
+    present_counts = present_df.values.sum(axis=1)
+
     for key in monthly_dfs:
-        current_df = monthly_dfs[key]
-        # Don't want income in this df
-        current_df.drop('income', axis = 1, inplace = True)
-        # Re-order the cols by placing the greatest summed columns first
-        current_df = current_df.ix[:, current_df.sum().sort_values(ascending=False).index]
-        # Save as a dict of dfs
-        outgoings_detail_dfs[key] = current_df
+        row = totals_df.index.get_loc(key)
+        ranked_cols = list(classifications[ranked_positions[row]][:present_counts[row]])
+
+        # Biggest first
+        detail_df = all_outgoings_df.xs(key, level='year')[ranked_cols].fillna(0)
 
-    return outgoings_detail_dfs
+        # Keep the biggest top_n cols and put everything else into "other"
+        summary_df = detail_df[ranked_cols[:top_n]].copy()
+        summary_df['other'] = detail_df[ranked_cols[top_n:]].sum(axis=1)
 
+        # Save as dicts of dfs
+        outgoings_detail_dfs[key] = detail_df
+        outgoings_summary_dfs[key] = summary_df
 
-def create_summary_outgoings(outgoings_detail_dfs):
+    return outgoings_detail_dfs, outgoings_summary_dfs
 
+
+def update_stacked_bars(ax, outgoings_df, income_df=None):
     '''
-    There are too many cols to make sense when the outgoings are graphed, so I'm going to get the biggest
-    10 of them, then combine the remaining ones into an "other" column.
+    Put a new year's numbers into the stacked bars (and income line) already
+    drawn on an axis, instead of clearing it and plotting everything again.
+    Only possible when the axis has a bar per month for the same number of
+    classifications, so the colours and the legend entries line up
+    :params: an axis, the outgoings df, and the income df if there's an income line
+    :return: True if the axis was updated, False if it needs drawing from scratch
     '''
 
-    # Initialise
-    outcome_summary_dfs = {}
-    
-    for key in outgoings_detail_dfs:
-        current_df = outgoings_detail_dfs[key]
-        # Get the names of the cols
-        orig_cols = list(current_df.columns)
-        # The cols are in order of size, so it's easy to get the ten biggest: just
-        # take the first ten cols... but first create an "other" col from the
-        # sum of the 11th to end col
-        current_df['other'] = current_df[orig_cols[11:]].sum(axis=1)
-        # We want to keep the first ten columns AND the "other" column
-        keep_columns = orig_cols[:10]
-        keep_columns.append('other')
-        outcome_summary_dfs[key] = current_df[keep_columns]
-
-    return outcome_summary_dfs
-
-
-def plot_summary_plots(income_dfs, outgoings_detail_dfs, outgoings_summary_dfs):
-    
-    # Since all of the three dict of dfs share the same keys, we can loop
-    # through them all quite easily using the keys from any one of them
-
-    for key in outgoings_summary_dfs:
-
-        # First plot the totals
-        # Plot the outgoings as a stacked bar chart
-        ax = outgoings_summary_dfs[key].plot(kind='bar', stacked=True)
-
-        # Now use the same axis to plot the incomings as a line
-        income_dfs[key].plot(kind='line', color='r', ax=ax)
-        
-        # Now for some formatting
-        # Get the labels round the right way
-        ax.set_xticklabels(labels=outgoings_summary_dfs[key].index, rotation=90)
-        # Set up legend
-        ax.legend(bbox_to_anchor=(1.35, 0),    # Place the legend outside the plot
-                   loc='lower right',          # This sets the zero point coordinate against which the bbox bit                                above relates 
-                   prop={'size': 8})           # Make legend font small
-        # Titles and axis labels
-        plt.title('Budget ' + str(key))
-        plt.ylabel('Expenditure (£)')
-        plt.xlabel('')
-
-        # Save the plot
-        plt.savefig(MONTHLIESPLOTSTORE + str(key) + '_monthly_summary.png', format = 'png', dpi = 150, bbox_inches='tight')
-
-        # Start the second plot which shows the detail of the "other" col
-        ax2 = outgoings_detail_dfs[key].plot(kind='bar', stacked=True)
-        
-        # Get the labels round the right way
-        ax2.set_xticklabels(labels=outgoings_detail_dfs[key].index, rotation=90)
-        # Set up legend
-        plt.legend(bbox_to_anchor=(1.35, 0),    # Place the legend outside the plot
-                   loc='lower right',           # This sets the zero point coordinate against which the bbox bit                                above relates 
-                   prop={'size': 8})            # Make legend font small
-        # Titles and axis labels
-        plt.title('Full detail of budget ' + str(key))
-        plt.ylabel('Expenditure (£)')
-        plt.xlabel('')
-
-        # Save the plot
-        plt.savefig(MONTHLIESPLOTSTORE + str(key) + '_monthly_detailed.png', format = 'png', dpi = 150, bbox_inches='tight')
-#        plt.show()
+    legend = ax.get_legend()
+    containers = ax.containers
+    if legend is None or len(containers) != len(outgoings_df.columns):
+        return False
+    if any(len(container) != len(outgoings_df) for container in containers):
+        return False
+    if len(ax.lines) != (0 if income_df is None else 1):
+        return False
+    if [label.get_text() for label in ax.get_xticklabels()] != [str(month) for month in outgoings_df.index]:
+        return False
+
+    # Stack the bars the way pandas does: positive values pile up from zero,
+    # negative ones pile down from it
+    values = outgoings_df.values.astype(np.float64)
+    positive_prior = np.zeros(len(outgoings_df))
+    negative_prior = np.zeros(len(outgoings_df))
+    for container, col, col_values in zip(containers, outgoings_df.columns, values.T):
+        bottoms = np.where(col_values >= 0, positive_prior, negative_prior)
+        positive_prior += np.clip(col_values, 0, None)
+        negative_prior += np.clip(col_values, None, 0)
+        for bar, bottom, height in zip(container.patches, bottoms, col_values):
+            bar.set_y(bottom)
+            bar.set_height(height)
+        container.set_label(str(col))
+
+    # The stacks give the y range straight away, which is a lot quicker than
+    # getting the axis to work it out again from every bar (relim)
+    y_values = [np.zeros(1), positive_prior, negative_prior]
+    if income_df is not None:
+        income_values = np.asarray(income_df, dtype=np.float64).ravel()
+        ax.lines[0].set_ydata(income_values)
+        y_values.append(income_values[~np.isnan(income_values)])
+    y_values = np.concatenate(y_values)
+
+    # The classifications are ranked by spend, so the legend entries change
+    # order from year to year even when the bars can be re-used
+    for text, label in zip(legend.get_texts(), ax.get_legend_handles_labels()[1]):
+        text.set_text(label)
+
+    ax.dataLim.intervaly = (y_values.min(), y_values.max())
+    ax.set_autoscaley_on(True)
+    ax.autoscale_view(scalex=False)
+
+    return True
+
+
+def draw_monthly_summary(ax, key, income_df, outgoings_summary_df):
+    '''
+    Draw one year's monthly summary (stacked outgoings plus an income line)
+    into an existing axis. If the axis already has last year's chart with the
+    same shape, the bars and line are updated in place, otherwise it's cleared
+    and drawn from scratch, so the same figure can be re-used for every year
+    :params: an axis, the year, and that year's income and summary outgoings dfs
+    :return: nothing
+    '''
+
+    if update_stacked_bars(ax, outgoings_summary_df, income_df):
+        ax.set_title('Budget ' + str(key))
+        return
+
+    ax.clear()
+
+    # Plot the outgoings as a stacked bar chart
+    outgoings_summary_df.plot(kind='bar', stacked=True, ax=ax)
+
+    # Now use the same axis to plot the incomings as a line
+    income_df.plot(kind='line', color='r', ax=ax)
+
+    # Now for some formatting
+    # Get the labels round the right way
+    ax.set_xticklabels(labels=outgoings_summary_df.index, rotation=90)
+    # Set up legend
+    ax.legend(bbox_to_anchor=(1.35, 0),    # Place the legend outside the plot
+              loc='lower right',           # This sets the zero point coordinate against which the bbox bit above relates 
+              prop={'size': 8})            # Make legend font small
+    # Titles and axis labels
+    ax.set_title('Budget ' + str(key))
+    ax.set_ylabel('Expenditure (£)')
+    ax.set_xlabel('')
+
+    return
+
+
+def draw_monthly_detail(ax, key, outgoings_detail_df):
+    '''
+    Draw one year's full detail of outgoings into an existing axis. Same
+    idea as draw_monthly_summary
+    :params: an axis, the year, and that year's detailed outgoings df
+    :return: nothing
+    '''
+
+    if update_stacked_bars(ax, outgoings_detail_df):
+        ax.set_title('Full detail of budget ' + str(key))
+        return
+
+    ax.clear()
+
+    outgoings_detail_df.plot(kind='bar', stacked=True, ax=ax)
+
+    # Get the labels round the right way
+    ax.set_xticklabels(labels=outgoings_detail_df.index, rotation=90)
+    # Set up legend
+    ax.legend(bbox_to_anchor=(1.35, 0),    # Place the legend outside the plot
+              loc='lower right',           # This sets the zero point coordinate against which the bbox bit above relates 
+              prop={'size': 8})            # Make legend font small
+    # Titles and axis labels
+    ax.set_title('Full detail of budget ' + str(key))
+    ax.set_ylabel('Expenditure (£)')
+    ax.set_xlabel('')
+
+    return
+
+
+def save_chart(figure, filename, dashboard_pdf=None):
+    '''
+    Save a chart either as its own png or as the next page of the dashboard
+    :params: a figure, the png filename to use, and an open dashboard pdf (or
+             None to save a png)
+    :return: nothing
+    '''
+
+    if dashboard_pdf is not None:
+        dashboard_pdf.savefig(figure, bbox_inches='tight')
+    else:
+        figure.savefig(filename, format = 'png', dpi = 150, bbox_inches='tight')
+
+    return
+
+
+@instrument
+def plot_summary_plots(income_dfs, outgoings_detail_dfs, outgoings_summary_dfs, dashboard_pdf=None):
+    '''
+    Plot the monthly summary and the monthly detail for every year. Only two
+    figures are ever created: each year's numbers go into the bars already
+    drawn for the year before where they can, and the figures are closed at
+    the end, so memory doesn't grow with the number of years
+    :params: dicts of income, detailed outgoings and summary outgoings dfs, and
+             an open dashboard pdf to add the charts to (None for pngs)
+    :return: nothing, saves the plots
+    '''
+
+    plt = get_pyplot()
+
+    summary_fig, summary_ax = plt.subplots()
+    detail_fig, detail_ax = plt.subplots()
+
+    try:
+        # Since all of the three dict of dfs share the same keys, we can loop
+        # through them all quite easily using the keys from any one of them.
+        # Sorted so the dashboard pages come out in order
+        for key in sorted(outgoings_summary_dfs):
+
+            # First plot the totals
+            draw_monthly_summary(summary_ax, key, income_dfs[key], outgoings_summary_dfs[key])
+            save_chart(summary_fig, MONTHLIESPLOTSTORE + str(key) + '_monthly_summary.png', dashboard_pdf)
+
+            # Then the second plot which shows the detail of the "other" col
+            draw_monthly_detail(detail_ax, key, outgoings_detail_dfs[key])
+            save_chart(detail_fig, MONTHLIESPLOTSTORE + str(key) + '_monthly_detailed.png', dashboard_pdf)
+    finally:
+        # Let go of the figures or pyplot hangs on to them forever
+        plt.close(summary_fig)
+        plt.close(detail_fig)
 
     return   
 
 
+@instrument
 def how_costs_change_over_years(all_years_by_month_df, unique_years):
 
     '''
@@ -236,41 +398,78 @@ def how_costs_change_over_years(all_years_by_month_df, unique_years):
     return annual_summaries_dfs
 
 
-def plot_how_costs_change_over_years(average_spend_by_year_df, unique_years):
+def draw_annual_spend(ax, curr_classification, average_spend_by_year_df, unique_years):
+    '''
+    Draw how the average monthly spend on one classification has changed over
+    the years into an existing axis. If the axis already has the line for
+    another classification over the same years, the line is just given the
+    new values, otherwise the axis is cleared and drawn from scratch
+    :params: an axis, the classification, the average spend by year df (sorted
+             by year) and the list of years
+    :return: nothing
+    '''
+
+    spend = average_spend_by_year_df[curr_classification].astype(float)
+    # Set a reasonable max y limit as being 10% greater than the max value
+    # in the col
+    y_limit_max = average_spend_by_year_df[curr_classification].max() * 1.1
+
+    # There's income in there as well as costs, so this is needed
+    # to make the plot titles make sense for both eventualities
+    if curr_classification == 'income':
+        title = 'Average monthly income'
+    else:
+        title = 'Average monthly spend on ' + curr_classification
+
+    if len(ax.lines) == 1 and np.array_equal(ax.lines[0].get_xdata(), spend.index):
+        ax.lines[0].set_ydata(spend.values)
+        ax.set_ylim([0, y_limit_max])
+        ax.set_title(title)
+        return
+
+    ax.clear()
+
+    #Plot
+    spend.plot(kind='line', color='r', xticks=unique_years, ylim=[0,y_limit_max], ax=ax)
+    ax.set_title(title)
+    ax.set_ylabel('Average monthly spend (£)')
+    ax.set_xlabel('')
+
+    return
+
+
+@instrument
+def plot_how_costs_change_over_years(average_spend_by_year_df, unique_years, dashboard_pdf=None):
     
     '''
-    Create plots that show how each classification of spending has changed over the years
+    Create plots that show how each classification of spending has changed over the years.
+    There's a chart per classification, so they're all drawn on the same
+    figure (each one just changes the line's values), which is closed at the end
+    :params: the average spend by year df, the list of years, and an open
+             dashboard pdf to add the charts to (None for pngs)
+    :return: nothing, saves the plots
     '''
     
+    plt = get_pyplot()
+
     # Get list of available classifications
     classifications = list(average_spend_by_year_df.columns)
 
     # Sort the index so that the years appear in order
     average_spend_by_year_df.sort_index(inplace=True)    
 
-    for curr_classification in classifications:
-        # Set a reasonable max y limit as being 10% greater than the max value
-        # in the col
-        y_limit_max = average_spend_by_year_df[curr_classification].max() * 1.1
-        #Plot
-        average_spend_by_year_df[curr_classification].plot(kind='line', color='r', xticks=unique_years, ylim=[0,y_limit_max])
-        # There's income in there as well as costs, so this is needed
-        # to make the plot titles make sense for both eventualities
-        if curr_classification == 'income':
-            title = 'Average monthly income'
-        else:
-            title = 'Average monthly spend on ' + curr_classification
-        plt.title(title)
-        plt.ylabel('Average monthly spend (£)')
-        plt.xlabel('')
-        plt.savefig(ANNUALSPLOTSTORE + 'annual_spend_' + curr_classification + '.png', format = 'png', dpi = 150, bbox_inches='tight')
-        # Clear the frame or everything goes really screwy when the
-        # next plot is made
-        plt.clf()
-#        plt.show()
+    figure, ax = plt.subplots()
+    try:
+        for curr_classification in classifications:
+            draw_annual_spend(ax, curr_classification, average_spend_by_year_df, unique_years)
+            save_chart(figure, ANNUALSPLOTSTORE + 'annual_spend_' + curr_classification + '.png', dashboard_pdf)
+    finally:
+        plt.close(figure)
+
     return
 
 
+@instrument
 def calculate_income_and_outgoings(total_spend_by_year_df):
 
     # Get list of available classifications
@@ -282,51 +481,112 @@ def calculate_income_and_outgoings(total_spend_by_year_df):
     return total_spend_by_year_df
 
 
-def plot_income_and_outgoings(income_outgoings_df, unique_years):
+def draw_income_and_outgoings(ax, income_outgoings_df, unique_years):
+    '''
+    Draw the total income and outgoings for each year into an existing axis
+    (which is cleared first)
+    :params: an axis, the income and outgoings df (sorted by year) and the list of years
+    :return: nothing
+    '''
+
+    ax.clear()
+
+    income_outgoings_df['income'].astype(float).plot(kind='line', color='b', xticks=unique_years, ax=ax)
+    income_outgoings_df['outgoings'].astype(float).plot(kind='line', color='r', ax=ax)
+
+    ax.legend()
+
+    ax.set_title('Income vs. outgoings')
+    ax.set_ylabel('£s')
+    ax.set_xlabel('')
+
+    return
+
+
+@instrument
+def plot_income_and_outgoings(income_outgoings_df, unique_years, dashboard_pdf=None):
+
+    '''
+    Plot the total income and outgoings for each year
+    :params: the income and outgoings df, the list of years, and an open
+             dashboard pdf to add the chart to (None for a png)
+    :return: nothing, saves the plot
+    '''
+
+    plt = get_pyplot()
 
     # Sort the index so that the years appear in order
     income_outgoings_df.sort_index(inplace=True)    
 
-    ax = income_outgoings_df['income'].plot(kind='line', color='b', xticks=unique_years)
-    income_outgoings_df['outgoings'].plot(kind='line', color='r', ax=ax)
+    figure, ax = plt.subplots()
+    try:
+        draw_income_and_outgoings(ax, income_outgoings_df, unique_years)
+        save_chart(figure, ANNUALSPLOTSTORE + 'total_income_outgoings.png', dashboard_pdf)
+    finally:
+        plt.close(figure)
 
-    plt.legend()
+    return
+
+
+def plot_everything(income_dfs, outgoings_detail_dfs, outgoings_summary_dfs, annual_summaries_dfs,
+                    income_outgoings_df, unique_years, dashboard=False):
+    '''
+    Draw all the charts: the monthly ones for every year in the dicts of dfs,
+    then the annual ones
+    :params: dicts of income, detailed outgoings and summary outgoings dfs, the
+             annual summaries, the income and outgoings df, the list of years,
+             and dashboard - if True, every chart is a page of one pdf rather
+             than its own png
+    :return: nothing, saves the plots
+    '''
+
+    dashboard_pdf = None
+    if dashboard:
+        from matplotlib.backends.backend_pdf import PdfPages
+        dashboard_pdf = PdfPages(DASHBOARDFILE)
 
-    plt.title('Income vs. outgoings')
-    plt.ylabel('£s')
-    plt.xlabel('')
-    plt.savefig(ANNUALSPLOTSTORE + 'total_income_outgoings.png', format = 'png', dpi = 150, bbox_inches='tight')
+    try:
+        plot_summary_plots(income_dfs, outgoings_detail_dfs, outgoings_summary_dfs, dashboard_pdf)
+        plot_how_costs_change_over_years(annual_summaries_dfs['average'], unique_years, dashboard_pdf)
+        plot_income_and_outgoings(income_outgoings_df, unique_years, dashboard_pdf)
+    finally:
+        if dashboard_pdf is not None:
+            dashboard_pdf.close()
 
     return
 
-def main():
+def main(render=False, dashboard=False, top_n=TOP_N_OUTGOINGS):
     """
     Main function to run program
+    :params: render - whether to actually draw and save the plots, dashboard -
+             whether to put all the plots into one pdf instead of pngs,
+             top_n - how many classifications to show before lumping the rest
+             into "other"
     """
 
     # I write back to the original dataframe and pandas warns about that, so turning off the warning    
     pd.options.mode.chained_assignment = None
 
-    # Read in all data
-    all_data_df = import_csv_to_df(DATA_FILE_DIR, DATAFILENAME)
-
-    # Create list of the years in the data
-    unique_years = what_years_in_data(all_data_df)
-
-    # Calculate daily spend
-    calculate_daily_spend(all_data_df)
-
-
+    # Calculate daily spend, from the array store if there is one (in which
+    # case the years come from it too, and all the data doesn't have to be read)
+    if arrays_exist():
+        store = load_arrays()
+        unique_years = np.unique(store['offsets'][:, 0]).tolist()
+        daily_spend = calculate_daily_spend(None, store)
+    else:
+        # Read in all data
+        all_data_df = import_csv_to_df(DATA_FILE_DIR, DATAFILENAME)
+        # Create list of the years in the data
+        unique_years = what_years_in_data(all_data_df)
+        daily_spend = calculate_daily_spend(all_data_df)
+    daily_spend.index.name = 'day'
+    export_to_csv(daily_spend.to_frame(), MONTHLIESFILESSTORE, 'daily_spend', True)
 
     # Get the monthly summary data...
     monthly_dfs = get_monthly_summaries(unique_years)
     # ...and use it to create dicts of dfs for each of income, detailed outgoings and summary outgoings
     income_dfs = create_incomings(monthly_dfs)
-    outgoings_detail_dfs = create_detailed_outgoings(monthly_dfs)
-    outgoings_summary_dfs = create_summary_outgoings(outgoings_detail_dfs)
-
-    # Plot monthly summaries
-#    plot_summary_plots(income_dfs, outgoings_detail_dfs, outgoings_summary_dfs)
+    outgoings_detail_dfs, outgoings_summary_dfs = rank_outgoings(monthly_dfs, top_n)
 
     # Break down all costs into average cost per classification per year
     all_years_by_month_df = import_csv_to_df(MONTHLIESFILESSTORE, BYMONTHDATA)
@@ -337,11 +597,14 @@ def main():
     # Quickly sum the outgoings into a single col
     income_outgoings_df = calculate_income_and_outgoings(annual_summaries_dfs['total'])
 
-    # Plot average cost per classification per year
-#    plot_how_costs_change_over_years(annual_summaries_dfs['average'], unique_years)
+    # Plot monthly summaries, average cost per classification per year and
+    # total income and outgoings per year
+    if render:
+        plot_everything(income_dfs, outgoings_detail_dfs, outgoings_summary_dfs, annual_summaries_dfs,
+                        income_outgoings_df, unique_years, dashboard)
 
-    # Plot total income and outgoings per year
-#    plot_income_and_outgoings(income_outgoings_df, unique_years)
+    # Save timings etc. if instrumentation has been switched on
+    write_report('plot_budget')
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
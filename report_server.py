@@ -0,0 +1,282 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+import pandas as pd
+import os
+import os.path
+import io
+import functools
+import html
+import urllib.parse
+from http.server import HTTPServer, BaseHTTPRequestHandler
+
+import plot_budget
+
+
+HOST = '127.0.0.1'
+PORT = 8000
+CACHE_SIZE = 64
+MONTHLY_BREAKDOWN_SUFFIX = '_monthly_breakdown.csv'
+
+# Everything the server shows comes out of these caches. Each cached function
+# takes a fingerprint of the csv it's built from (modified time and size), so
+# when analyse_budget re-writes a year the fingerprint changes and only that
+# year gets worked out again. Old entries just drop off the end of the LRU
+
+
+def fingerprint(filename):
+
+    '''
+    Something that changes whenever the file does
+    '''
+    stats = os.stat(filename)
+    return (stats.st_mtime_ns, stats.st_size)
+
+
+def available_years():
+
+    '''
+    Get a list of the years that have a monthly breakdown to show
+    '''
+    years = []
+    if os.path.exists(plot_budget.MONTHLIESFILESSTORE):
+        for file in os.listdir(plot_budget.MONTHLIESFILESSTORE):
+            if file.endswith(MONTHLY_BREAKDOWN_SUFFIX):
+                year = file[:-len(MONTHLY_BREAKDOWN_SUFFIX)]
+                if year.isdigit():
+                    years.append(int(year))
+    years.sort()
+
+    return years
+
+
+def year_fingerprint(year):
+
+    '''
+    Fingerprint of the monthly breakdown for a year
+    '''
+    return fingerprint(plot_budget.MONTHLIESFILESSTORE + str(year) + MONTHLY_BREAKDOWN_SUFFIX)
+
+
+def all_years_fingerprint():
+
+    '''
+    Fingerprint of the all years by month rollup
+    '''
+    return fingerprint(plot_budget.MONTHLIESFILESSTORE + plot_budget.BYMONTHDATA + '.csv')
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def get_year_frames(year, year_fingerprint):
+    '''
+    Work out the monthly breakdown, income, detailed and summary outgoings for
+    a year, the same way plot_budget does
+    :params: the year, and the fingerprint of its monthly breakdown (only used
+             to tell the cache when the data has changed)
+    :return: a dict of dfs
+    '''
+
+    monthly_dfs = plot_budget.get_monthly_summaries([year])
+    income_dfs = plot_budget.create_incomings(monthly_dfs)
+    outgoings_detail_dfs, outgoings_summary_dfs = plot_budget.rank_outgoings(monthly_dfs)
+
+    return {'monthly': monthly_dfs[year],
+            'income': income_dfs[year],
+            'detail': outgoings_detail_dfs[year],
+            'summary': outgoings_summary_dfs[year]}
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def get_annual_frames(all_years_fingerprint):
+    '''
+    Work out the average and total spend per classification per year, and
+    the income vs outgoings, the same way plot_budget does
+    :params: the fingerprint of the all years rollup (only used to tell the
+             cache when the data has changed)
+    :return: a dict of dfs
+    '''
+
+    all_years_by_month_df = plot_budget.import_csv_to_df(plot_budget.MONTHLIESFILESSTORE, plot_budget.BYMONTHDATA)
+    unique_years = plot_budget.what_years_in_data(all_years_by_month_df)
+    annual_summaries_dfs = plot_budget.how_costs_change_over_years(all_years_by_month_df, unique_years)
+    income_outgoings_df = plot_budget.calculate_income_and_outgoings(annual_summaries_dfs['total'].copy())
+    income_outgoings_df.sort_index(inplace=True)
+
+    return {'average': annual_summaries_dfs['average'].sort_index(),
+            'total': annual_summaries_dfs['total'].sort_index(),
+            'income outgoings': income_outgoings_df[['income', 'outgoings']]}
+
+
+def figure_to_png(draw, *args):
+    '''
+    Draw a chart onto a fresh figure and turn it into png bytes. This doesn't
+    go anywhere near pyplot, so nothing hangs around once it's drawn and it
+    works without a display
+    :params: a function that draws onto an axis, and the rest of its arguments
+    :return: the png as bytes
+    '''
+
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    figure = Figure()
+    FigureCanvasAgg(figure)
+    draw(figure.add_subplot(111), *args)
+    png = io.BytesIO()
+    figure.savefig(png, format='png', dpi=100, bbox_inches='tight')
+
+    return png.getvalue()
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def get_chart(chart, key, data_fingerprint):
+    '''
+    Render a chart to png
+    :params: which chart ('summary', 'detail', 'annual spend' or 'income
+             outgoings'), the year for the monthly charts (the classification
+             for 'annual spend', None for 'income outgoings'), and the
+             fingerprint of the data it's drawn from (only used to tell the
+             cache when the data has changed)
+    :return: the png as bytes
+    '''
+
+    if chart in ('income outgoings', 'annual spend'):
+        frames = get_annual_frames(data_fingerprint)
+        unique_years = list(frames['average'].index)
+        if chart == 'annual spend':
+            return figure_to_png(plot_budget.draw_annual_spend, key, frames['average'], unique_years)
+        return figure_to_png(plot_budget.draw_income_and_outgoings, frames['income outgoings'], unique_years)
+
+    frames = get_year_frames(key, data_fingerprint)
+    if chart == 'summary':
+        return figure_to_png(plot_budget.draw_monthly_summary, key, frames['income'], frames['summary'])
+
+    return figure_to_png(plot_budget.draw_monthly_detail, key, frames['detail'])
+
+
+def page(title, body):
+
+    '''
+    Wrap some html up into a page
+    '''
+    return ('<!DOCTYPE html><html><head><meta charset="utf-8"><title>' + html.escape(title) + '</title></head>'
+            '<body><p><a href="/">All years</a> | <a href="/annual">Annual summary</a></p>'
+            '<h1>' + html.escape(title) + '</h1>' + body + '</body></html>')
+
+
+def df_to_html(df):
+
+    '''
+    Turn a df into an html table with the money rounded to pennies
+    '''
+    return df.to_html(float_format='{:.2f}'.format, na_rep='')
+
+
+class ReportHandler(BaseHTTPRequestHandler):
+
+    '''
+    Serves the pages, charts and csvs. Everything goes through the caches above
+    '''
+
+    def do_GET(self):
+        path = self.path.split('?')[0].strip('/')
+        parts = path.split('/') if path else []
+
+        try:
+            if len(parts) == 0:
+                self.send_index()
+            elif parts == ['annual']:
+                self.send_annual()
+            elif len(parts) == 2 and parts[0] == 'year' and parts[1].isdigit():
+                self.send_year(int(parts[1]))
+            elif len(parts) == 2 and parts[0] == 'charts':
+                self.send_chart(parts[1])
+            elif len(parts) == 2 and parts[0] == 'data':
+                self.send_data(parts[1])
+            else:
+                self.send_error(404)
+        except FileNotFoundError:
+            self.send_error(404, 'No data for that yet')
+        except Exception as error:
+            self.log_error('Failed to serve %s: %r', self.path, error)
+            self.send_error(500, 'Something went wrong working that out')
+
+    def send_content(self, content, content_type):
+        if isinstance(content, str):
+            content = content.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def send_index(self):
+        links = ''.join('<li><a href="/year/{0}">{0}</a></li>'.format(year) for year in available_years())
+        self.send_content(page('Budget', '<ul>' + links + '</ul>'), 'text/html; charset=utf-8')
+
+    def send_year(self, year):
+        frames = get_year_frames(year, year_fingerprint(year))
+        body = ('<img src="/charts/{0}_summary.png"><img src="/charts/{0}_detail.png">'
+                '<p><a href="/data/{0}.csv">Download the monthly breakdown</a></p>').format(year)
+        body += df_to_html(frames['monthly'])
+        self.send_content(page('Budget ' + str(year), body), 'text/html; charset=utf-8')
+
+    def send_annual(self):
+        frames = get_annual_frames(all_years_fingerprint())
+        charts = ''.join('<img src="/charts/annual_spend_' + urllib.parse.quote(classification, safe='') + '.png">'
+                         for classification in frames['average'].columns)
+        body = ('<img src="/charts/income_outgoings.png">'
+                '<h2>Average monthly spend by year</h2>' + charts +
+                '<h2>Total spend</h2>' + df_to_html(frames['total']) +
+                '<h2>Average monthly spend</h2>' + df_to_html(frames['average']))
+        self.send_content(page('Annual summary', body), 'text/html; charset=utf-8')
+
+    def send_chart(self, name):
+        if name == 'income_outgoings.png':
+            png = get_chart('income outgoings', None, all_years_fingerprint())
+        elif name.startswith('annual_spend_') and name.endswith('.png'):
+            classification = urllib.parse.unquote(name[len('annual_spend_'):-len('.png')])
+            data_fingerprint = all_years_fingerprint()
+            if classification not in get_annual_frames(data_fingerprint)['average'].columns:
+                self.send_error(404)
+                return
+            png = get_chart('annual spend', classification, data_fingerprint)
+        else:
+            year, _, chart = name.partition('_')
+            if not year.isdigit() or chart not in ('summary.png', 'detail.png'):
+                self.send_error(404)
+                return
+            png = get_chart(chart[:-len('.png')], int(year), year_fingerprint(int(year)))
+        self.send_content(png, 'image/png')
+
+    def send_data(self, name):
+        if name in ('annual_total.csv', 'annual_average.csv'):
+            df = get_annual_frames(all_years_fingerprint())[name[len('annual_'):-len('.csv')]]
+        elif name.endswith('.csv') and name[:-len('.csv')].isdigit():
+            year = int(name[:-len('.csv')])
+            df = get_year_frames(year, year_fingerprint(year))['monthly']
+        else:
+            self.send_error(404)
+            return
+        self.send_content(df.to_csv(), 'text/csv; charset=utf-8')
+
+
+def main(host=HOST, port=PORT):
+    """
+    Main function to run program
+    :params: the address and port to serve on
+    """
+
+    # I write back to the original dataframe and pandas warns about that, so turning off the warning
+    pd.options.mode.chained_assignment = None
+
+    server = HTTPServer((host, port), ReportHandler)
+    print('Serving the budget on http://' + host + ':' + str(port) + '/')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print('Stopped serving')
+    server.server_close()
+
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,221 @@
 #!/usr/bin/env python
 # encoding: utf-8
 
-import collect_and_classify
-import analyse_budget
-import plot_budget
+import argparse
+import sys
 
+from instrumentation import enable_instrumentation
 
-collect_and_classify
-analyse_budget
-plot_budget
\ No newline at end of file
+# Nothing heavy gets imported up here. Each subcommand imports the module it
+# needs when it runs, so "classify my statements" doesn't have to wait for
+# matplotlib, and asking for --help doesn't even have to wait for pandas
+
+
+def run_ingest(args):
+
+    '''
+    Read new statements, classify them and save all_data.csv
+    '''
+    import collect_and_classify
+    collect_and_classify.main()
+
+
+def run_analyse(args):
+
+    '''
+    Break the classified data into years and monthly summaries
+    '''
+    import analyse_budget
+    analyse_budget.main()
+
+
+def run_plot(args):
+
+    '''
+    Build the summaries for plotting and (unless told not to) draw them
+    '''
+    import plot_budget
+    plot_budget.main(render=not args.no_render, dashboard=args.dashboard, top_n=args.top_n)
+
+
+def run_reclassify(args):
+
+    '''
+    Re-apply transaction_types.csv to the data that's already been collected
+    '''
+    import collect_and_classify
+    collect_and_classify.reclassify()
+
+
+def run_watch(args):
+
+    '''
+    Keep watching for new statements and process them as they turn up
+    '''
+    import watch_statements
+    watch_statements.watch(args.poll, args.debounce, render=not args.no_render)
+
+
+def run_query(args):
+
+    '''
+    Answer questions from the transaction database without loading everything
+    '''
+    import transaction_db
+    if args.list:
+        rows = transaction_db.find_transactions(args.start, args.end, args.account, args.classification, args.vendor)
+    else:
+        rows = transaction_db.sum_transactions(args.group_by, args.start, args.end, args.account, args.classification, args.vendor,
+                                               args.include_transfers)
+    transaction_db.print_rows(rows)
+
+
+def run_forecast(args):
+
+    '''
+    Forecast how much is still to come in and go out this month
+    '''
+    import forecast_budget
+    forecast_budget.main(args.as_of, args.months)
+
+
+def run_serve(args):
+
+    '''
+    Serve the summaries and charts on a local web page
+    '''
+    import report_server
+    report_server.main(args.host, args.port)
+
+
+def run_all(args):
+
+    '''
+    Run the whole lot, one after the other
+    '''
+    run_ingest(args)
+    run_analyse(args)
+    run_plot(args)
+
+
+def at_least_one(value):
+
+    '''
+    argparse type for counts that have to be 1 or more
+    '''
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError('has to be at least 1, not ' + value)
+    return number
+
+
+def create_parser():
+    '''
+    Set up the command line arguments
+    :params: nothing
+    :return: an argparse parser
+    '''
+
+    parser = argparse.ArgumentParser(description='Collect, classify, analyse and plot bank statements')
+    parser.add_argument('--profile', action='store_true',
+                        help='record timings, memory and row counts for each stage')
+    parser.add_argument('--profile-stage', default=None,
+                        help='name of a stage (e.g. monthly_summaries_from_arrays) to dump a cProfile for')
+
+    subparsers = parser.add_subparsers(dest='command')
+
+    ingest_parser = subparsers.add_parser('ingest', help='read and classify new bank statements')
+    ingest_parser.set_defaults(func=run_ingest)
+
+    analyse_parser = subparsers.add_parser('analyse', help='create yearly and monthly summaries')
+    analyse_parser.set_defaults(func=run_analyse)
+
+    plot_parser = subparsers.add_parser('plot', help='plot the summaries')
+    plot_parser.add_argument('--no-render', action='store_true',
+                             help='calculate the plot data but do not draw anything')
+    plot_parser.add_argument('--dashboard', action='store_true',
+                             help='put all the plots into one pdf')
+    plot_parser.add_argument('--top-n', type=at_least_one, default=10,
+                             help='number of classifications in the summary plots before the rest go into "other"')
+    plot_parser.set_defaults(func=run_plot)
+
+    reclassify_parser = subparsers.add_parser('reclassify', help='re-apply transaction_types.csv to all_data.csv')
+    reclassify_parser.set_defaults(func=run_reclassify)
+
+    watch_parser = subparsers.add_parser('watch', help='keep processing new statements as they arrive')
+    watch_parser.add_argument('--poll', type=float, default=5,
+                              help='seconds between looks for new statements')
+    watch_parser.add_argument('--debounce', type=float, default=30,
+                              help='seconds without new files before a batch is processed')
+    watch_parser.add_argument('--no-render', action='store_true',
+                              help='update the data but do not draw anything')
+    watch_parser.set_defaults(func=run_watch)
+
+    query_parser = subparsers.add_parser('query', help='total or list transactions from the database')
+    query_parser.add_argument('--start', default=None,
+                              help='first date to include, as YYYY-MM-DD')
+    query_parser.add_argument('--end', default=None,
+                              help='last date to include, as YYYY-MM-DD')
+    query_parser.add_argument('--account', action='append', default=None,
+                              help='account to include (can be given more than once)')
+    query_parser.add_argument('--classification', action='append', default=None,
+                              help='classification to include (can be given more than once)')
+    query_parser.add_argument('--vendor', default=None,
+                              help='only vendors containing this text')
+    query_parser.add_argument('--group-by', default='classification',
+                              choices=['classification', 'account', 'vendor', 'trans type', 'year', 'month'],
+                              help='what to total the money by')
+    query_parser.add_argument('--list', action='store_true',
+                              help='list the transactions rather than totalling them')
+    query_parser.add_argument('--include-transfers', action='store_true',
+                              help='count transfers between our own accounts in the totals')
+    query_parser.set_defaults(func=run_query)
+
+    forecast_parser = subparsers.add_parser('forecast', help='forecast the month end balance for each account')
+    forecast_parser.add_argument('--as-of', default=None,
+                                 help='date to forecast from, as YYYY-MM-DD (default is the latest transaction)')
+    forecast_parser.add_argument('--months', type=int, default=12,
+                                 help='how many months of history to base the forecast on')
+    forecast_parser.set_defaults(func=run_forecast)
+
+    serve_parser = subparsers.add_parser('serve', help='show the summaries and charts on a local web page')
+    serve_parser.add_argument('--host', default='127.0.0.1',
+                              help='address to serve on')
+    serve_parser.add_argument('--port', type=int, default=8000,
+                              help='port to serve on')
+    serve_parser.set_defaults(func=run_serve)
+
+    all_parser = subparsers.add_parser('all', help='ingest, analyse and plot')
+    all_parser.add_argument('--no-render', action='store_true',
+                            help='calculate the plot data but do not draw anything')
+    all_parser.add_argument('--dashboard', action='store_true',
+                            help='put all the plots into one pdf')
+    all_parser.add_argument('--top-n', type=at_least_one, default=10,
+                            help='number of classifications in the summary plots before the rest go into "other"')
+    all_parser.set_defaults(func=run_all)
+
+    return parser
+
+
+def main(argv=None):
+    """
+    Main function to run program
+    """
+
+    parser = create_parser()
+    args = parser.parse_args(argv)
+
+    # No subcommand means nothing to do, so don't import anything
+    if args.command is None:
+        parser.print_help()
+        return 0
+
+    if args.profile or args.profile_stage is not None:
+        enable_instrumentation(args.profile_stage)
+
+    args.func(args)
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
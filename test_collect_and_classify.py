@@ -0,0 +1,225 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+import os
+
+import pandas as pd
+
+import collect_and_classify
+from collect_and_classify import match_transfers, validate_balances, drop_overlapping_rows, check_balances, add_to_all_data
+
+
+def make_transactions(rows):
+    '''
+    Transactions shaped like the ones create_trans_types hands on, from a list
+    of (account name, date, trans type, money in, money out, balance)
+    '''
+
+    dataframe = pd.DataFrame(rows, columns=['account name', 'date', 'trans type', 'money in', 'money out', 'balance'])
+    dataframe['date'] = pd.to_datetime(dataframe['date'])
+
+    return dataframe
+
+
+def test_transfer_legs_are_matched():
+    dataframe = make_transactions([
+        ('simons', '2016-04-01', 'inter account transfers', 0, 200, 800),
+        ('dellas', '2016-04-02', 'inter account transfers', 200, 0, 1200),
+    ])
+    dataframe = match_transfers(dataframe)
+
+    assert dataframe['transfer id'].notnull().all()
+    assert dataframe.loc[0, 'transfer id'] == dataframe.loc[1, 'transfer id'] == 'simons 800.00 > dellas 1200.00'
+
+
+def test_only_inter_account_transfers_are_matched():
+    # A direct debit and an unrelated payment in for the same amount
+    dataframe = make_transactions([
+        ('simons', '2016-04-01', 'regular payments', 0, 200, 800),
+        ('dellas', '2016-04-01', 'payment received', 200, 0, 1200),
+    ])
+    dataframe = match_transfers(dataframe)
+
+    assert dataframe['transfer id'].isnull().all()
+
+
+def test_competing_legs_for_the_same_amount_go_to_the_closest():
+    # Two transfers out for the same amount, but only one has come in, and
+    # it's closest to the second one
+    dataframe = make_transactions([
+        ('simons', '2016-04-01', 'inter account transfers', 0, 50, 950),
+        ('simons', '2016-04-04', 'inter account transfers', 0, 50, 900),
+        ('dellas', '2016-04-04', 'inter account transfers', 50, 0, 1050),
+    ])
+    dataframe = match_transfers(dataframe)
+
+    assert pd.isnull(dataframe.loc[0, 'transfer id'])
+    assert dataframe.loc[1, 'transfer id'] == dataframe.loc[2, 'transfer id']
+
+
+def test_each_leg_is_only_matched_once():
+    dataframe = make_transactions([
+        ('simons', '2016-04-01', 'inter account transfers', 0, 50, 950),
+        ('simons', '2016-04-02', 'inter account transfers', 0, 50, 900),
+        ('dellas', '2016-04-02', 'inter account transfers', 50, 0, 1050),
+        ('dellas', '2016-04-03', 'inter account transfers', 50, 0, 1100),
+    ])
+    dataframe = match_transfers(dataframe)
+
+    assert dataframe['transfer id'].notnull().all()
+    assert dataframe['transfer id'].nunique() == 2
+
+
+def test_tolerance_is_inclusive():
+    dataframe = make_transactions([
+        ('simons', '2016-04-01', 'inter account transfers', 0, 200, 800),
+        ('dellas', '2016-04-04', 'inter account transfers', 200, 0, 1200),
+        ('simons', '2016-05-01', 'inter account transfers', 0, 300, 500),
+        ('dellas', '2016-05-05', 'inter account transfers', 300, 0, 1500),
+    ])
+    dataframe = match_transfers(dataframe, tolerance_days=3)
+
+    # Three days apart is a match, four isn't
+    assert dataframe.loc[0:1, 'transfer id'].notnull().all()
+    assert dataframe.loc[0, 'transfer id'] == dataframe.loc[1, 'transfer id']
+    assert dataframe.loc[2:3, 'transfer id'].isnull().all()
+
+
+def test_legs_split_across_batches_are_matched():
+    # The first batch had the money going out, and was matched on its own
+    first_batch = make_transactions([
+        ('simons', '2016-04-01', 'inter account transfers', 0, 200, 800),
+        ('simons', '2016-04-01', 'inter account transfers', 0, 75, 725),
+        ('dellas', '2016-04-01', 'inter account transfers', 75, 0, 1075),
+    ])
+    first_batch = match_transfers(first_batch)
+    first_id = first_batch.loc[1, 'transfer id']
+    assert pd.isnull(first_batch.loc[0, 'transfer id'])
+
+    # The second batch has the money coming in, and gets matched along with
+    # what's already been collected
+    second_batch = make_transactions([
+        ('dellas', '2016-04-02', 'inter account transfers', 200, 0, 1275),
+    ])
+    combined = pd.concat([first_batch, second_batch], ignore_index=True)
+    combined = match_transfers(combined)
+
+    assert combined.loc[0, 'transfer id'] == combined.loc[3, 'transfer id'] == 'simons 800.00 > dellas 1275.00'
+    # What was matched before keeps its id
+    assert combined.loc[1, 'transfer id'] == combined.loc[2, 'transfer id'] == first_id
+
+
+def make_statement(rows):
+    '''
+    Transactions shaped like the ones find_bank_statements reads in, from a
+    list of (account name, date, description, money in, money out, balance)
+    '''
+
+    dataframe = pd.DataFrame(rows, columns=['account name', 'date', 'description', 'money in', 'money out', 'balance'])
+    dataframe['date'] = pd.to_datetime(dataframe['date'])
+
+    return dataframe
+
+
+# Two months of one account, with a bit of another
+JANUARY = [
+    ('simons', '2016-01-02', 'card payment to tesco', 0, 10, 90),
+    ('simons', '2016-01-05', 'card payment to boots', 0, 20, 70),
+    ('dellas', '2016-01-06', 'credit from work', 500, 0, 1500),
+]
+FEBRUARY = [
+    ('simons', '2016-02-01', 'card payment to tesco', 0, 5, 65),
+    ('simons', '2016-02-03', 'credit from work', 100, 0, 165),
+]
+
+
+def test_balances_that_carry_on_have_no_problems():
+    problems_df = validate_balances(make_statement(JANUARY + FEBRUARY))
+
+    assert len(problems_df) == 0
+
+
+def test_missing_statement_is_a_gap():
+    # Drop the last transaction in January, so February doesn't carry on from anything
+    problems_df = validate_balances(make_statement(JANUARY[:1] + JANUARY[2:] + FEBRUARY))
+
+    assert problems_df.to_dict('records') == [{'account name': 'simons', 'problem': 'gap', 'from': pd.Timestamp('2016-01-02'),
+                                               'to': pd.Timestamp('2016-02-01'), 'rows': 1}]
+
+
+def test_statement_read_twice_is_an_overlap():
+    problems_df = validate_balances(make_statement(JANUARY + FEBRUARY + JANUARY[:2]))
+
+    assert problems_df.to_dict('records') == [{'account name': 'simons', 'problem': 'overlap', 'from': pd.Timestamp('2016-01-02'),
+                                               'to': pd.Timestamp('2016-01-05'), 'rows': 2}]
+
+
+def test_gap_after_the_previous_balances_is_found():
+    # The stored statements finished on a balance February doesn't start from
+    previous_balances = pd.DataFrame([('simons', '2016-01-20', 80.0)], columns=['account name', 'date', 'balance'])
+    problems_df = validate_balances(make_statement(FEBRUARY), previous_balances)
+
+    assert problems_df.to_dict('records') == [{'account name': 'simons', 'problem': 'gap', 'from': pd.Timestamp('2016-01-20'),
+                                               'to': pd.Timestamp('2016-02-01'), 'rows': 1}]
+
+    previous_balances = pd.DataFrame([('simons', '2016-01-05', 70.0)], columns=['account name', 'date', 'balance'])
+    assert len(validate_balances(make_statement(FEBRUARY), previous_balances)) == 0
+
+
+def test_rows_already_stored_are_an_overlap():
+    # January has been read before, and is being read again along with February
+    stored_keys = [(account, description, balance) for account, date, description, money_in, money_out, balance in JANUARY]
+    problems_df = validate_balances(make_statement(JANUARY + FEBRUARY), stored_keys=stored_keys)
+
+    assert problems_df.to_dict('records') == [
+        {'account name': 'dellas', 'problem': 'overlap', 'from': pd.Timestamp('2016-01-06'), 'to': pd.Timestamp('2016-01-06'), 'rows': 1},
+        {'account name': 'simons', 'problem': 'overlap', 'from': pd.Timestamp('2016-01-02'), 'to': pd.Timestamp('2016-01-05'), 'rows': 2},
+    ]
+
+
+def test_overlapping_rows_are_dropped():
+    stored_keys = [('simons', 'card payment to tesco', 90.0)]
+    dataframe = drop_overlapping_rows(make_statement(JANUARY + FEBRUARY + JANUARY[1:2]), stored_keys)
+
+    assert dataframe['description'].tolist() == ['card payment to boots', 'credit from work', 'card payment to tesco', 'credit from work']
+    assert dataframe.index.tolist() == [0, 1, 2, 3]
+
+
+def test_old_balance_problems_are_cleared(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs(collect_and_classify.DATA_FILE_DIR)
+
+    check_balances(make_statement(JANUARY[1:]))
+    assert not os.path.exists(collect_and_classify.DATA_FILE_DIR + 'balance_problems.csv')
+
+    check_balances(make_statement(JANUARY + JANUARY[:1]))
+    assert os.path.exists(collect_and_classify.DATA_FILE_DIR + 'balance_problems.csv')
+
+    check_balances(make_statement(JANUARY))
+    assert not os.path.exists(collect_and_classify.DATA_FILE_DIR + 'balance_problems.csv')
+
+
+def test_new_rows_are_added_to_all_data(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs(collect_and_classify.DATA_FILE_DIR)
+
+    january_df = make_statement(JANUARY)
+    january_df['transfer id'] = None
+    add_to_all_data(january_df)
+    february_df = make_statement(FEBRUARY)
+    february_df['transfer id'] = None
+    add_to_all_data(february_df)
+
+    all_df = pd.read_csv(collect_and_classify.DATA_FILE_DIR + 'all_data.csv')
+    assert all_df['description'].tolist() == [row[2] for row in JANUARY + FEBRUARY]
+    assert all_df['transfer id'].isnull().all()
+
+    # An earlier row that's been matched up since gets its transfer id
+    rematched_df = make_statement(JANUARY[2:])
+    rematched_df['transfer id'] = 'simons 1.00 > dellas 1500.00'
+    add_to_all_data(make_statement([]), rematched_df)
+
+    all_df = pd.read_csv(collect_and_classify.DATA_FILE_DIR + 'all_data.csv')
+    assert len(all_df) == 5
+    assert all_df['transfer id'].tolist()[2] == 'simons 1.00 > dellas 1500.00'
+    assert all_df['transfer id'].notnull().sum() == 1
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+import calendar
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from matplotlib.figure import Figure
+
+from plot_budget import rank_outgoings, draw_monthly_summary, draw_monthly_detail
+
+
+def make_monthly_dfs():
+    '''
+    Monthly dfs shaped like the ones get_monthly_summaries reads in: a col per
+    classification (different ones each year, with some empty months), an
+    income col and the month names as the index
+    '''
+
+    rng = np.random.RandomState(0)
+    monthly_dfs = {}
+    for year, number_of_classifications in [(2015, 14), (2016, 11), (2017, 3)]:
+        data = {'class ' + str(i): rng.rand(12) * 100 for i in range(number_of_classifications)}
+        data['income'] = rng.rand(12) * 1000
+        monthly_df = pd.DataFrame(data, index=pd.Index([calendar.month_name[i] for i in range(1, 13)], name='month name'))
+        # Months with no transactions are empty
+        monthly_df.iloc[[0, 5], :] = np.nan
+        monthly_dfs[year] = monthly_df
+
+    return monthly_dfs
+
+
+@pytest.mark.parametrize('top_n', [1, 3, 10, 20])
+def test_summed_outgoings_are_conserved(top_n):
+    monthly_dfs = make_monthly_dfs()
+    outgoings_detail_dfs, outgoings_summary_dfs = rank_outgoings(monthly_dfs, top_n)
+
+    for year, monthly_df in monthly_dfs.items():
+        # Every month's outgoings in the summary (top_n cols + other) should
+        # add up to every outgoing classification in the original monthly df
+        expected = monthly_df.drop('income', axis=1).fillna(0).sum(axis=1)
+        np.testing.assert_allclose(outgoings_summary_dfs[year].sum(axis=1).values, expected.values)
+        np.testing.assert_allclose(outgoings_detail_dfs[year].sum(axis=1).values, expected.values)
+
+
+def test_summary_keeps_top_n_biggest_and_other():
+    monthly_dfs = make_monthly_dfs()
+    outgoings_detail_dfs, outgoings_summary_dfs = rank_outgoings(monthly_dfs, 10)
+
+    for year, monthly_df in monthly_dfs.items():
+        totals = monthly_df.drop('income', axis=1).sum().sort_values(ascending=False)
+        assert list(outgoings_detail_dfs[year].columns) == list(totals.index)
+        assert list(outgoings_summary_dfs[year].columns) == list(totals.index[:10]) + ['other']
+        # The 11th biggest classification goes into "other" rather than vanishing
+        np.testing.assert_allclose(outgoings_summary_dfs[year]['other'].sum(), totals.iloc[10:].sum())
+
+
+def test_monthly_dfs_are_not_changed():
+    monthly_dfs = make_monthly_dfs()
+    originals = {year: monthly_df.copy() for year, monthly_df in monthly_dfs.items()}
+
+    rank_outgoings(monthly_dfs, 5)
+
+    for year, monthly_df in monthly_dfs.items():
+        pd.testing.assert_frame_equal(monthly_df, originals[year])
+
+
+@pytest.mark.parametrize('top_n', [0, -1])
+def test_top_n_below_one_is_rejected(top_n):
+    with pytest.raises(ValueError):
+        rank_outgoings(make_monthly_dfs(), top_n)
+
+
+def chart_contents(ax):
+    '''
+    What's actually on a monthly chart: the bars (as x, bottom, height), the
+    lines, the legend and the y range
+    '''
+
+    bars = [[(bar.get_x(), bar.get_y(), bar.get_height()) for bar in container] for container in ax.containers]
+    lines = [np.asarray(line.get_ydata(), dtype=float) for line in ax.lines]
+    legend = [text.get_text() for text in ax.get_legend().get_texts()]
+
+    return bars, lines, legend, ax.get_ylim(), ax.get_title()
+
+
+def test_reused_axis_matches_a_fresh_one():
+    monthly_dfs = make_monthly_dfs()
+    income_dfs = {year: monthly_df[['income']] for year, monthly_df in monthly_dfs.items()}
+    # The same number of summary cols every year, so the bars get re-used,
+    # but a different number of detail cols, so those get drawn from scratch
+    outgoings_detail_dfs, outgoings_summary_dfs = rank_outgoings(monthly_dfs, 3)
+
+    reused_summary_ax = Figure().subplots()
+    reused_detail_ax = Figure().subplots()
+    for year in sorted(monthly_dfs):
+        draw_monthly_summary(reused_summary_ax, year, income_dfs[year], outgoings_summary_dfs[year])
+        draw_monthly_detail(reused_detail_ax, year, outgoings_detail_dfs[year])
+
+        fresh_summary_ax = Figure().subplots()
+        draw_monthly_summary(fresh_summary_ax, year, income_dfs[year], outgoings_summary_dfs[year])
+        fresh_detail_ax = Figure().subplots()
+        draw_monthly_detail(fresh_detail_ax, year, outgoings_detail_dfs[year])
+
+        for reused_ax, fresh_ax in [(reused_summary_ax, fresh_summary_ax), (reused_detail_ax, fresh_detail_ax)]:
+            reused_bars, reused_lines, reused_legend, reused_ylim, reused_title = chart_contents(reused_ax)
+            fresh_bars, fresh_lines, fresh_legend, fresh_ylim, fresh_title = chart_contents(fresh_ax)
+            np.testing.assert_allclose(reused_bars, fresh_bars)
+            for reused_line, fresh_line in zip(reused_lines, fresh_lines):
+                np.testing.assert_allclose(reused_line, fresh_line)
+            assert (reused_legend, reused_title) == (fresh_legend, fresh_title)
+            np.testing.assert_allclose(reused_ylim, fresh_ylim)
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+import sqlite3
+
+import pandas as pd
+
+from transaction_db import SCHEMA, save_df_to_db, sum_transactions, find_transactions
+
+
+def make_transactions():
+    '''
+    A transfer from simons to dellas (both legs matched up), and some spending
+    '''
+
+    return pd.DataFrame({
+        'date': pd.to_datetime(['2016-04-01', '2016-04-02', '2016-05-10', '2016-06-20']),
+        'account name': ['simons', 'dellas', 'simons', 'dellas'],
+        'description': ['transfer to dellas', 'transfer from simons', 'card payment to tesco', 'card payment to tesco'],
+        'classification': [None, None, 'groceries', 'groceries'],
+        'money in': [0, 200, 0, 0],
+        'money out': [200, 0, 30, 20],
+        'balance': [800, 1200, 770, 1180],
+        'transfer id': ['simons 800.00 > dellas 1200.00', 'simons 800.00 > dellas 1200.00', None, None],
+    })
+
+
+def test_transfers_are_left_out_of_the_totals(tmp_path):
+    filename = str(tmp_path / 'transactions.db')
+    save_df_to_db(make_transactions(), filename)
+
+    rows = sum_transactions('account', '2016-04-01', '2016-06-30', filename=filename)
+    totals = {row['account']: (row['money in'], row['money out']) for row in rows}
+    assert totals == {'simons': (0, 30), 'dellas': (0, 20)}
+
+
+def test_transfers_can_be_included(tmp_path):
+    filename = str(tmp_path / 'transactions.db')
+    save_df_to_db(make_transactions(), filename)
+
+    rows = sum_transactions('account', '2016-04-01', '2016-06-30', include_transfers=True, filename=filename)
+    totals = {row['account']: (row['money in'], row['money out']) for row in rows}
+    assert totals == {'simons': (0, 230), 'dellas': (200, 20)}
+
+
+def test_transfer_ids_are_stored(tmp_path):
+    filename = str(tmp_path / 'transactions.db')
+    save_df_to_db(make_transactions(), filename)
+
+    rows = find_transactions(accounts=['dellas'], filename=filename)
+    assert [row['transfer_id'] for row in rows] == ['simons 800.00 > dellas 1200.00', None]
+
+
+def test_older_databases_get_the_transfer_col(tmp_path):
+    filename = str(tmp_path / 'transactions.db')
+    # The table as it was before transfer ids were stored
+    connection = sqlite3.connect(filename)
+    connection.executescript(SCHEMA.replace('    transfer_id TEXT,\n', ''))
+    connection.close()
+
+    save_df_to_db(make_transactions(), filename)
+
+    rows = sum_transactions('account', filename=filename)
+    assert {row['account']: row['money out'] for row in rows} == {'simons': 30, 'dellas': 20}
@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+import os
+
+import pandas as pd
+import pytest
+
+import analyse_budget
+import collect_and_classify
+import transaction_arrays
+import watch_statements
+
+
+def make_statement(account, rows):
+    '''
+    A statement shaped like the ones find_bank_statements reads in, from a
+    list of (date, description, money in, money out, balance)
+    '''
+
+    dataframe = pd.DataFrame(rows, columns=['date', 'description', 'money in', 'money out', 'balance'])
+    dataframe['date'] = pd.to_datetime(dataframe['date'])
+    dataframe['account name'] = account
+    for col in ['short description', 'vendor', 'trans type', 'classification', 'keyword']:
+        dataframe[col] = None
+    dataframe['year'] = dataframe['date'].dt.year
+    dataframe['month'] = dataframe['date'].dt.month
+
+    return dataframe
+
+
+# A spend every week of 2016 up to the end of October, then one statement
+# for November
+EARLIER_ROWS = [(date, 'card payment to tesco,' + str(number), 0, 10, 10000 - 10 * (number + 1))
+                for number, date in enumerate(pd.date_range('2016-01-04', '2016-10-31', freq='W-MON'))]
+NOVEMBER_ROWS = [('2016-11-07', 'card payment to tesco,nov 1', 0, 10, 10000 - 10 * (len(EARLIER_ROWS) + 1)),
+                 ('2016-11-14', 'card payment to tesco,nov 2', 0, 10, 10000 - 10 * (len(EARLIER_ROWS) + 2))]
+DECEMBER_ROWS = [('2016-12-05', 'card payment to tesco,dec 1', 0, 10, 10000 - 10 * (len(EARLIER_ROWS) + 3))]
+
+
+@pytest.fixture
+def budget_dir(tmp_path, monkeypatch):
+    '''
+    An empty set of budget dirs to run in, with statements that are handed
+    straight to the pipeline rather than read from xlsx files
+    '''
+
+    monkeypatch.chdir(tmp_path)
+    for directory in [collect_and_classify.DATA_FILE_DIR, analyse_budget.ANNUALSUMMARIESSTORE,
+                      analyse_budget.OUTPUTFILESSTORE + 'monthly_breakdowns/']:
+        os.makedirs(directory)
+    pd.DataFrame([('groceries', 'tesco')], columns=['classification', 'keyword']).reindex(
+        columns=['account name', 'classification', 'date', 'description', 'keyword', 'money in', 'money out',
+                 'short description', 'trans type', 'vendor']).to_csv(collect_and_classify.TRANSACTIONTYPES + '.csv', index=False)
+
+    statements = {}
+    monkeypatch.setattr(collect_and_classify, 'find_bank_statements', lambda filenames=None: statements['next'].copy())
+
+    return statements
+
+
+def year_rows(year):
+
+    '''
+    The transactions in the yearly store for a year
+    '''
+    return pd.read_csv(analyse_budget.ANNUALSUMMARIESSTORE + str(year) + '_annual_summary.csv')
+
+
+def test_watch_batch_keeps_the_rest_of_the_year(budget_dir):
+    # Batch run over everything up to October
+    budget_dir['next'] = make_statement('simons', EARLIER_ROWS)
+    collect_and_classify.main()
+    analyse_budget.main()
+    assert len(year_rows(2016)) == len(EARLIER_ROWS)
+
+    # Then the watch picks up November, and then December
+    budget_dir['next'] = make_statement('simons', NOVEMBER_ROWS)
+    assert watch_statements.ingest_statements(['november.xlsx']) == [2016]
+    budget_dir['next'] = make_statement('simons', DECEMBER_ROWS)
+    assert watch_statements.ingest_statements(['december.xlsx']) == [2016]
+
+    assert len(year_rows(2016)) == len(EARLIER_ROWS) + len(NOVEMBER_ROWS) + len(DECEMBER_ROWS)
+    monthly_df = pd.read_csv(analyse_budget.OUTPUTFILESSTORE + 'monthly_breakdowns/2016_monthly_breakdown.csv')
+    assert monthly_df['groceries'].notnull().all()
+    assert monthly_df['groceries'].sum() == pytest.approx(10 * len(year_rows(2016)))
+
+    store = transaction_arrays.load_arrays()
+    rows = transaction_arrays.year_slice(store, 2016)
+    assert rows.stop - rows.start == len(year_rows(2016))
+
+    # And analyse still works after the watch has been at it
+    analyse_budget.main()
+    assert len(year_rows(2016)) == len(EARLIER_ROWS) + len(NOVEMBER_ROWS) + len(DECEMBER_ROWS)
+
+
+def test_failed_watch_batch_is_picked_up_again(budget_dir, monkeypatch):
+    budget_dir['next'] = make_statement('simons', EARLIER_ROWS)
+    collect_and_classify.main()
+    analyse_budget.main()
+
+    def broken_update(annual_dfs):
+        raise OSError('disk full')
+
+    budget_dir['next'] = make_statement('simons', NOVEMBER_ROWS)
+    with monkeypatch.context() as patch:
+        patch.setattr(analyse_budget, 'update_arrays', broken_update)
+        with pytest.raises(OSError):
+            watch_statements.ingest_statements(['november.xlsx'])
+
+    # Nothing was marked as read, so the same statement goes through next time
+    assert len(pd.read_csv(collect_and_classify.DATA_FILE_DIR + 'all_data.csv')) == len(EARLIER_ROWS)
+    assert watch_statements.ingest_statements(['november.xlsx']) == [2016]
+    assert len(pd.read_csv(collect_and_classify.DATA_FILE_DIR + 'all_data.csv')) == len(EARLIER_ROWS) + len(NOVEMBER_ROWS)
+    assert len(year_rows(2016)) == len(EARLIER_ROWS) + len(NOVEMBER_ROWS)
@@ -0,0 +1,325 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+import pandas as pd
+import numpy as np
+import os
+import os.path
+import json
+import calendar
+
+from instrumentation import instrument
+
+
+ARRAYSTORE = "./output_files/arrays/"
+
+# The numeric columns of the transactions, each saved as its own typed array
+NUMERIC_COLUMNS = {
+    'money in': np.float64,
+    'money out': np.float64,
+    'balance': np.float64,
+    'year': np.int16,
+    'month': np.int8,
+    'day': np.int8,
+}
+# Text columns are saved as codes into a list of the names (-1 for NaN)
+CODED_COLUMNS = ['classification', 'account name']
+ARRAY_NAMES = list(NUMERIC_COLUMNS) + ['date', 'classification', 'account name', 'transfer']
+
+
+def array_filename(location, name):
+
+    '''
+    Where an array lives (spaces in filenames are a pain)
+    '''
+    return location + name.replace(' ', '_') + '.npy'
+
+
+def arrays_exist(location=ARRAYSTORE):
+
+    '''
+    Has the array store been built yet?
+    '''
+    return os.path.exists(location + 'categories.json')
+
+
+def dataframe_to_arrays(dataframe):
+    '''
+    Turn a dataframe of transactions into typed arrays, sorted by date
+    :params: a dataframe of transactions
+    :return: a dict of the arrays, and a dict of the lists of names for the
+             coded columns
+    '''
+
+    # Sort by date (stable, so transactions on the same day keep their order)
+    dates = pd.to_datetime(dataframe['date'])
+    order = np.argsort(dates.values, kind='mergesort')
+    dates = dates.iloc[order]
+
+    arrays = {
+        'date': dates.values.astype('datetime64[D]'),
+        'money in': dataframe['money in'].fillna(0).values[order],
+        'money out': dataframe['money out'].fillna(0).values[order],
+        'balance': dataframe['balance'].values[order],
+        # Take the year, month and day from the date so they agree with the sort
+        'year': dates.dt.year.values,
+        'month': dates.dt.month.values,
+        'day': dates.dt.day.values,
+    }
+    for name, dtype in NUMERIC_COLUMNS.items():
+        arrays[name] = arrays[name].astype(dtype)
+
+    # Matched inter account transfers (see match_transfers)
+    if 'transfer id' in dataframe.columns:
+        arrays['transfer'] = dataframe['transfer id'].notnull().values[order]
+    else:
+        arrays['transfer'] = np.zeros(len(dataframe), dtype=bool)
+
+    categories = {}
+    for name in CODED_COLUMNS:
+        codes, names = pd.factorize(dataframe[name].values[order], sort=True)
+        arrays[name] = codes.astype(np.int32)
+        categories[name] = [str(category) for category in names]
+
+    return arrays, categories
+
+
+def run_offsets(years, months, first_row=0):
+    '''
+    Rows are sorted by date, so each year/month is one run of rows. Find
+    where each run starts and ends
+    :params: the year and month arrays, and the row number of their first row
+    :return: an array with a row of year, month, start, end for each run
+    '''
+
+    if len(years) == 0:
+        return np.empty((0, 4), dtype=np.int64)
+
+    year_month = years.astype(np.int64) * 100 + months
+    run_starts = np.flatnonzero(np.r_[True, year_month[1:] != year_month[:-1]])
+    run_ends = np.r_[run_starts[1:], len(year_month)].astype(np.int64)
+
+    return np.column_stack([years[run_starts], months[run_starts], run_starts + first_row, run_ends + first_row]).astype(np.int64)
+
+
+def write_arrays(arrays, offsets, categories, location):
+    '''
+    Write out the arrays, offsets and names for the coded columns. They go to
+    temporary files that are then swapped in, so nothing reading the store
+    sees half of an update
+    :params: a dict of arrays, the offsets, the coded column names and the store
+    :return: nothing, saves the arrays
+    '''
+
+    if not os.path.exists(location):
+        os.makedirs(location)
+
+    for name in ARRAY_NAMES:
+        np.save(array_filename(location, name) + '.tmp.npy', arrays[name])
+        os.replace(array_filename(location, name) + '.tmp.npy', array_filename(location, name))
+    np.save(array_filename(location, 'offsets') + '.tmp.npy', offsets)
+    os.replace(array_filename(location, 'offsets') + '.tmp.npy', array_filename(location, 'offsets'))
+    with open(location + 'categories.json.tmp', 'w') as categories_file:
+        json.dump(categories, categories_file)
+    os.replace(location + 'categories.json.tmp', location + 'categories.json')
+
+    return
+
+
+@instrument
+def save_arrays(dataframe, location=ARRAYSTORE):
+    '''
+    Save the transactions as typed arrays, sorted by date, with a sidecar of
+    where each year and month starts and ends. That way a year or a month is
+    just a slice of each array rather than a filter over everything
+    :params: a dataframe of transactions and the store to save them in
+    :return: nothing, saves the arrays
+    '''
+
+    arrays, categories = dataframe_to_arrays(dataframe)
+    write_arrays(arrays, run_offsets(arrays['year'], arrays['month']), categories, location)
+
+    return
+
+
+def load_arrays(location=ARRAYSTORE):
+    '''
+    Open the array store. The arrays are memory mapped, so nothing is read
+    until it's used, and slicing them doesn't copy anything
+    :params: the store to open
+    :return: a dict of the arrays, plus 'offsets' (rows of year, month, start,
+             end) and the lists of names for the coded columns
+    '''
+
+    store = {}
+    for name in ARRAY_NAMES:
+        store[name] = np.load(array_filename(location, name), mmap_mode='r')
+    store['offsets'] = np.load(array_filename(location, 'offsets'))
+    with open(location + 'categories.json') as categories_file:
+        categories = json.load(categories_file)
+    for name in CODED_COLUMNS:
+        store[name + ' names'] = categories[name]
+
+    return store
+
+
+def year_slice(store, year):
+    '''
+    Get the rows for a year
+    :params: the array store and a year
+    :return: a slice to index the arrays with (empty if the year isn't there)
+    '''
+
+    offsets = store['offsets']
+    rows = offsets[offsets[:, 0] == year]
+    if len(rows) == 0:
+        return slice(0, 0)
+
+    return slice(int(rows[:, 2].min()), int(rows[:, 3].max()))
+
+
+@instrument
+def update_arrays(annual_dfs, location=ARRAYSTORE):
+    '''
+    Replace the years in annual_dfs in the array store, keeping all the other
+    years as they are. Only the years that have changed get built from their
+    dfs; the rest are copied straight across from the store, with their runs
+    in the offsets moved along rather than found again
+    :params: a dict of dfs of transactions, one per year, and the store
+    :return: nothing, saves the arrays
+    '''
+
+    # Nothing's changed
+    if len(annual_dfs) == 0:
+        return
+
+    new_df = pd.concat(list(annual_dfs.values()), ignore_index=True)
+    if not arrays_exist(location):
+        save_arrays(new_df, location)
+        return
+
+    store = load_arrays(location)
+    new_arrays, new_categories = dataframe_to_arrays(new_df)
+    new_years = set(np.unique(new_arrays['year']).tolist()) | set(annual_dfs)
+    stored_years = np.unique(store['offsets'][:, 0]).tolist()
+
+    # The new years might bring new names for the coded columns, so work out
+    # the codes for everything against the combined lists. Code -1 (NaN)
+    # picks up the -1 on the end of each lookup
+    categories = {}
+    stored_codes = {}
+    new_codes = {}
+    for name in CODED_COLUMNS:
+        categories[name] = sorted(set(store[name + ' names']) | set(new_categories[name]))
+        code_of = {category: code for code, category in enumerate(categories[name])}
+        stored_codes[name] = np.array([code_of[category] for category in store[name + ' names']] + [-1], dtype=np.int32)
+        new_codes[name] = np.array([code_of[category] for category in new_categories[name]] + [-1], dtype=np.int32)
+
+    # Each year is one run of rows, so stitch the years back together in
+    # order, taking each one either from the store or from the new arrays
+    pieces = {name: [] for name in ARRAY_NAMES}
+    offsets = []
+    first_row = 0
+    for year in sorted(set(stored_years) | new_years):
+        if year in new_years:
+            start, end = np.searchsorted(new_arrays['year'], [year, year + 1])
+            rows = slice(int(start), int(end))
+            for name in ARRAY_NAMES:
+                pieces[name].append(new_arrays[name][rows])
+            for name in CODED_COLUMNS:
+                pieces[name][-1] = new_codes[name][pieces[name][-1]]
+            offsets.append(run_offsets(new_arrays['year'][rows], new_arrays['month'][rows], first_row))
+        else:
+            rows = year_slice(store, year)
+            for name in ARRAY_NAMES:
+                pieces[name].append(store[name][rows])
+            for name in CODED_COLUMNS:
+                pieces[name][-1] = stored_codes[name][pieces[name][-1]]
+            year_offsets = store['offsets'][store['offsets'][:, 0] == year].copy()
+            year_offsets[:, 2:] += first_row - rows.start
+            offsets.append(year_offsets)
+        first_row += rows.stop - rows.start
+
+    arrays = {name: np.concatenate(pieces[name]) for name in ARRAY_NAMES}
+    write_arrays(arrays, np.concatenate(offsets).astype(np.int64), categories, location)
+
+    return
+
+
+@instrument
+def monthly_summaries_from_arrays(store, unique_years):
+    '''
+    Summarise the spend on each classification per month. Unclassified
+    transactions, the 'ignore' classification and matched transfers are left
+    out. Each year is a slice of the arrays, and the sums for every month and
+    classification are done in one bincount
+    :params: the array store and a list of years to summarise
+    :return: a dict of monthly summary dfs, one per year
+    '''
+
+    # Initialise dict for storage
+    monthly_dfs = {}
+
+    classification_names = store['classification names']
+    number_of_classifications = len(classification_names)
+    # Unclassified (-1), 'ignore' and matched transfers are left out. Rather
+    # than picking the other rows out (which copies them), they're summed
+    # into a spare classification on the end that's then thrown away
+    ignore_code = classification_names.index('ignore') if 'ignore' in classification_names else -2
+    left_out = number_of_classifications
+    grid_width = number_of_classifications + 1
+
+    offsets = store['offsets']
+    for year in unique_years:
+        rows = year_slice(store, year)
+        # Each month is one run of rows, so the month of every row comes
+        # straight from the offsets
+        year_offsets = offsets[offsets[:, 0] == year]
+        month_index = np.repeat(year_offsets[:, 1] - 1, year_offsets[:, 3] - year_offsets[:, 2])
+
+        codes = store['classification'][rows].astype(np.int64)
+        keep = (codes >= 0) & (codes != ignore_code) & ~store['transfer'][rows]
+        codes = np.where(keep, codes, left_out)
+
+        # Every month x classification total in one go
+        grid_index = month_index * grid_width + codes
+        counts = np.bincount(grid_index, minlength=12 * grid_width).reshape(12, grid_width)[:, :left_out]
+        money_out = np.bincount(grid_index, weights=store['money out'][rows], minlength=12 * grid_width).reshape(12, grid_width)
+        money_in = np.bincount(grid_index, weights=store['money in'][rows], minlength=12 * grid_width).reshape(12, grid_width)
+
+        # Months with no transactions are left empty
+        has_data = counts.sum(axis=1) > 0
+
+        monthly_summary_df = pd.DataFrame(index=pd.Index(range(1, 13), name='month'))
+        for code in np.flatnonzero(counts.sum(axis=0)):
+            # Income is the only classification that requires the 'money in' column to be summed
+            if classification_names[code] == 'income':
+                totals = money_in[:, code]
+            else:
+                totals = money_out[:, code]
+            monthly_summary_df[classification_names[code]] = np.where(has_data, totals, np.nan)
+        monthly_summary_df['month name'] = [calendar.month_name[month] for month in range(1, 13)]
+
+        monthly_dfs[year] = monthly_summary_df
+
+    return monthly_dfs
+
+
+@instrument
+def daily_spend_from_arrays(store, year=None):
+    '''
+    The average money out for each day of the month, as in
+    plot_budget.calculate_daily_spend, but from the array store
+    :params: the array store and a year to look at (None for everything)
+    :return: a series of the average money out, indexed by day of the month
+    '''
+
+    rows = slice(None) if year is None else year_slice(store, year)
+    days = store['day'][rows].astype(np.int64)
+    totals = np.bincount(days, weights=store['money out'][rows], minlength=32)
+    counts = np.bincount(days, minlength=32)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        averages = totals / counts
+
+    return pd.Series(averages[1:], index=range(1, 32), name='money out')
@@ -0,0 +1,321 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+import sqlite3
+import os.path
+
+DATABASE_FILE = "./data/transactions.db"
+
+# The columns in the dfs, and what they're called in the database (sql
+# doesn't like spaces in column names)
+DF_TO_DB_COLUMNS = [
+    ('date', 'date'),
+    ('account name', 'account_name'),
+    ('description', 'description'),
+    ('short description', 'short_description'),
+    ('vendor', 'vendor'),
+    ('trans type', 'trans_type'),
+    ('classification', 'classification'),
+    ('keyword', 'keyword'),
+    ('money in', 'money_in'),
+    ('money out', 'money_out'),
+    ('balance', 'balance'),
+    ('year', 'year'),
+    ('month', 'month'),
+    ('transfer id', 'transfer_id'),
+]
+
+# Things it makes sense to group the totals by
+GROUP_BY_COLUMNS = {
+    'classification': 'classification',
+    'account': 'account_name',
+    'vendor': 'vendor',
+    'trans type': 'trans_type',
+    'year': 'year',
+    'month': "substr(date, 1, 7)",
+}
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS transactions (
+    date TEXT NOT NULL,
+    account_name TEXT,
+    description TEXT,
+    short_description TEXT,
+    vendor TEXT,
+    trans_type TEXT,
+    classification TEXT,
+    keyword TEXT,
+    money_in REAL NOT NULL DEFAULT 0,
+    money_out REAL NOT NULL DEFAULT 0,
+    balance REAL,
+    year INTEGER,
+    month INTEGER,
+    transfer_id TEXT,
+    UNIQUE (account_name, description, balance)
+);
+CREATE INDEX IF NOT EXISTS transactions_date ON transactions (date);
+CREATE INDEX IF NOT EXISTS transactions_account_date ON transactions (account_name, date);
+CREATE INDEX IF NOT EXISTS transactions_classification_date ON transactions (classification, date);
+CREATE INDEX IF NOT EXISTS transactions_vendor ON transactions (vendor);
+'''
+
+
+def connect_to_db(filename=DATABASE_FILE):
+    '''
+    Open the transaction database, creating the table and indexes if they
+    aren't there yet
+    :params: the database file
+    :return: a sqlite connection
+    '''
+
+    connection = sqlite3.connect(filename)
+    connection.row_factory = sqlite3.Row
+    connection.executescript(SCHEMA)
+
+    # Databases made before transfers were matched up don't have the col
+    columns = [row['name'] for row in connection.execute('PRAGMA table_info(transactions)')]
+    if 'transfer_id' not in columns:
+        with connection:
+            connection.execute('ALTER TABLE transactions ADD COLUMN transfer_id TEXT')
+
+    return connection
+
+
+def save_df_to_db(dataframe, filename=DATABASE_FILE):
+    '''
+    Save classified transactions into the database. The same transaction
+    (same account, description and balance, which is how breakdown_into_years
+    spots duplicates too) is only ever stored once, but its classification is
+    updated, so re-classifying and re-saving does the right thing
+    :params: a df of classified transactions and the database file
+    :return: the number of rows given to the database
+    '''
+
+    # pandas is only needed for saving, so the queries don't have to wait for it
+    import pandas as pd
+
+    df_columns = [df_col for df_col, db_col in DF_TO_DB_COLUMNS if df_col in dataframe.columns]
+    db_columns = [db_col for df_col, db_col in DF_TO_DB_COLUMNS if df_col in dataframe.columns]
+
+    save_df = dataframe[df_columns].copy()
+    # Store dates as ISO strings, so they sort and compare properly as text
+    save_df['date'] = pd.to_datetime(save_df['date']).dt.strftime('%Y-%m-%d')
+    for money_col in ['money in', 'money out']:
+        if money_col in save_df.columns:
+            save_df[money_col] = save_df[money_col].fillna(0)
+    # sqlite wants None rather than NaN
+    save_df = save_df.astype(object).where(pd.notnull(save_df), None)
+
+    updates = ', '.join(col + ' = excluded.' + col for col in db_columns)
+    sql = ('INSERT INTO transactions (' + ', '.join(db_columns) + ') VALUES (' + ', '.join('?' * len(db_columns)) + ') '
+           'ON CONFLICT (account_name, description, balance) DO UPDATE SET ' + updates)
+
+    connection = connect_to_db(filename)
+    with connection:
+        connection.executemany(sql, save_df.values.tolist())
+    connection.close()
+
+    return len(save_df)
+
+
+def build_filters(start_date=None, end_date=None, accounts=None, classifications=None, vendor=None,
+                  include_transfers=True):
+    '''
+    Turn the query options into a sql WHERE clause and its parameters
+    :params: inclusive start and end dates as YYYY-MM-DD strings, lists of
+             accounts and classifications, part of a vendor name, and whether
+             to include transfers between our own accounts
+    :return: the where clause (which might be empty) and a list of parameters
+    '''
+
+    conditions = []
+    parameters = []
+
+    if start_date is not None:
+        conditions.append('date >= ?')
+        parameters.append(start_date)
+    if end_date is not None:
+        conditions.append('date <= ?')
+        parameters.append(end_date)
+    if accounts:
+        conditions.append('account_name IN (' + ', '.join('?' * len(accounts)) + ')')
+        parameters.extend(accounts)
+    if classifications:
+        conditions.append('classification IN (' + ', '.join('?' * len(classifications)) + ')')
+        parameters.extend(classifications)
+    if vendor is not None:
+        conditions.append('vendor LIKE ?')
+        parameters.append('%' + vendor + '%')
+    if not include_transfers:
+        conditions.append('transfer_id IS NULL')
+
+    if len(conditions) == 0:
+        return '', parameters
+
+    return ' WHERE ' + ' AND '.join(conditions), parameters
+
+
+def sum_transactions(group_by='classification', start_date=None, end_date=None, accounts=None,
+                     classifications=None, vendor=None, include_transfers=False, filename=DATABASE_FILE):
+    '''
+    Total the money in and out, grouped by something, over a date range. For
+    example, how much on groceries in Q2 across all accounts is
+    sum_transactions('classification', '2016-04-01', '2016-06-30', classifications=['groceries'])
+    Matched transfers between our own accounts are left out unless asked
+    for, otherwise they count as both money in and money out
+    :params: what to group by (a key of GROUP_BY_COLUMNS), then the filters
+             that build_filters takes, and the database file
+    :return: a list of dicts, one per group, biggest spend first
+    '''
+
+    group_col = GROUP_BY_COLUMNS[group_by]
+    where, parameters = build_filters(start_date, end_date, accounts, classifications, vendor, include_transfers)
+
+    sql = ('SELECT ' + group_col + ' AS "' + group_by + '", '
+           'SUM(money_in) AS "money in", SUM(money_out) AS "money out", COUNT(*) AS "transactions" '
+           'FROM transactions' + where + ' GROUP BY ' + group_col + ' ORDER BY "money out" DESC')
+
+    connection = connect_to_db(filename)
+    rows = [dict(row) for row in connection.execute(sql, parameters)]
+    connection.close()
+
+    return rows
+
+
+def find_transactions(start_date=None, end_date=None, accounts=None, classifications=None,
+                      vendor=None, filename=DATABASE_FILE):
+    '''
+    Get the individual transactions that match the filters, in date order
+    :params: the filters that build_filters takes, and the database file
+    :return: a list of dicts, one per transaction
+    '''
+
+    where, parameters = build_filters(start_date, end_date, accounts, classifications, vendor)
+    sql = 'SELECT * FROM transactions' + where + ' ORDER BY date'
+
+    connection = connect_to_db(filename)
+    rows = [dict(row) for row in connection.execute(sql, parameters)]
+    connection.close()
+
+    return rows
+
+
+def find_existing_keys(start_date, end_date, accounts, filename=DATABASE_FILE):
+    '''
+    Get the account, description and balance (the key that marks a
+    transaction as a duplicate) of everything already stored over a date
+    range, so the ingest can skip rows it's seen before
+    :params: inclusive start and end dates as YYYY-MM-DD strings, a list of
+             accounts, and the database file
+    :return: a list of (account name, description, balance) tuples
+    '''
+
+    if not os.path.exists(filename):
+        return []
+
+    where, parameters = build_filters(start_date, end_date, accounts)
+    sql = 'SELECT account_name, description, balance FROM transactions' + where
+
+    connection = connect_to_db(filename)
+    keys = [tuple(row) for row in connection.execute(sql, parameters)]
+    connection.close()
+
+    return keys
+
+
+def find_unmatched_transfers(start_date, end_date, trans_types, filename=DATABASE_FILE):
+    '''
+    Get the stored transactions that could be one leg of a transfer but
+    haven't been matched up with the other leg yet, so a new batch of
+    statements can be matched against them
+    :params: inclusive start and end dates as YYYY-MM-DD strings, a list of
+             the trans types a transfer shows up as, and the database file
+    :return: a df with the same cols as the dfs that get saved (empty if
+             there's nothing)
+    '''
+
+    # pandas is only needed here, so the queries don't have to wait for it
+    import pandas as pd
+
+    df_columns = [df_col for df_col, db_col in DF_TO_DB_COLUMNS]
+    if not os.path.exists(filename):
+        return pd.DataFrame(columns=df_columns)
+
+    where, parameters = build_filters(start_date, end_date)
+    sql = ('SELECT ' + ', '.join(db_col for df_col, db_col in DF_TO_DB_COLUMNS) + ' FROM transactions' + where +
+           (' AND ' if where else ' WHERE ') + 'transfer_id IS NULL AND trans_type IN (' + ', '.join('?' * len(trans_types)) + ')')
+
+    connection = connect_to_db(filename)
+    rows = [tuple(row) for row in connection.execute(sql, parameters + list(trans_types))]
+    connection.close()
+
+    dataframe = pd.DataFrame(rows, columns=df_columns)
+    dataframe['date'] = pd.to_datetime(dataframe['date'])
+
+    return dataframe
+
+
+def find_last_balances(before_dates, filename=DATABASE_FILE):
+    '''
+    Get the balances on the last day stored for each account before a given
+    date, i.e. where the statements already read finished, so the next batch
+    can be checked against them
+    :params: a dict of account name to a YYYY-MM-DD date, and the database file
+    :return: a list of (account name, date, balance) tuples
+    '''
+
+    if not os.path.exists(filename):
+        return []
+
+    sql = ('SELECT account_name, date, balance FROM transactions WHERE account_name = ? AND date = '
+           '(SELECT MAX(date) FROM transactions WHERE account_name = ? AND date < ?)')
+
+    connection = connect_to_db(filename)
+    balances = []
+    for account, date in before_dates.items():
+        balances.extend(tuple(row) for row in connection.execute(sql, (account, account, date)))
+    connection.close()
+
+    return balances
+
+
+def print_rows(rows):
+
+    '''
+    Print a list of dicts as a simple table
+    '''
+    if len(rows) == 0:
+        print('No transactions found')
+        return
+
+    columns = list(rows[0].keys())
+    widths = [max(len(str(col)), max(len(format_value(row[col])) for row in rows)) for col in columns]
+    print('  '.join(str(col).ljust(width) for col, width in zip(columns, widths)))
+    for row in rows:
+        print('  '.join(format_value(row[col]).ljust(width) for col, width in zip(columns, widths)))
+
+    return
+
+
+def format_value(value):
+
+    '''
+    Money gets two decimal places, everything else is just a string
+    '''
+    if isinstance(value, float):
+        return '{:.2f}'.format(value)
+    return '' if value is None else str(value)
+
+
+def main():
+    """
+    Main function to run program
+    """
+    if not os.path.exists(DATABASE_FILE):
+        print('No database at ' + DATABASE_FILE + ' yet, run the ingest first')
+        return
+
+    print_rows(sum_transactions())
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,227 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+import pandas as pd
+import os
+import os.path
+import time
+
+import collect_and_classify
+import analyse_budget
+from instrumentation import write_report
+
+POLL_SECONDS = 5
+DEBOUNCE_SECONDS = 30
+MONTHLY_BREAKDOWN_SUFFIX = '_monthly_breakdown.csv'
+
+
+def snapshot_statements():
+
+    '''
+    Get the size and modified time of every unprocessed statement, so we can
+    tell when new ones arrive and when they've stopped being written to
+    '''
+    snapshot = {}
+    for file in os.listdir(collect_and_classify.UNPROCESSED_STATEMENTS):
+        if file.endswith('.xlsx'):
+            stats = os.stat(collect_and_classify.UNPROCESSED_STATEMENTS + file)
+            snapshot[file] = (stats.st_size, stats.st_mtime)
+
+    return snapshot
+
+
+def years_with_monthly_breakdowns():
+
+    '''
+    Get a list of the years that already have a monthly breakdown saved
+    '''
+    monthly_store = analyse_budget.OUTPUTFILESSTORE + 'monthly_breakdowns/'
+    years = []
+    if os.path.exists(monthly_store):
+        for file in os.listdir(monthly_store):
+            if file.endswith(MONTHLY_BREAKDOWN_SUFFIX):
+                year = file[:-len(MONTHLY_BREAKDOWN_SUFFIX)]
+                if year.isdigit():
+                    years.append(int(year))
+    years.sort()
+
+    return years
+
+
+def ingest_statements(filenames):
+    '''
+    Read and classify only the given statements, merge them into the yearly
+    store and update the monthly breakdowns for just the years they touch
+    :params: a list of statement filenames in the unprocessed statements dir
+    :return: a list of the years that were updated
+    '''
+
+    # Collect and classify, same as collect_and_classify.main but only for
+    # the new files
+    new_df, rematched_df, df_class = collect_and_classify.classify_new_transactions(filenames)
+    # Nothing new in these statements
+    if len(new_df) == 0:
+        return []
+    df = pd.concat([new_df, rematched_df], ignore_index=True)
+
+    # Merge the new (and newly matched) transactions into the yearly store.
+    # breakdown_into_years reads each year from the annual summaries (which
+    # analyse writes too) and drops duplicates, keeping the new version
+    updated_years = analyse_budget.what_years_in_data(df)
+    annual_dfs = analyse_budget.breakdown_into_years(df, updated_years)
+
+    # The monthly summaries for the updated years come from the whole of each
+    # year, not just the new transactions
+    analyse_budget.update_arrays(annual_dfs)
+    monthly_dfs = analyse_budget.monthly_summaries_from_arrays(analyse_budget.load_arrays(), updated_years)
+
+    analyse_budget.save_out_dict_of_dfs(annual_dfs, 'annual_summary', 'annual_summaries')
+    analyse_budget.save_out_dict_of_dfs(monthly_dfs, 'monthly_breakdown', 'monthly_breakdowns')
+
+    # Rebuild the all years rollup, reading back the years that didn't change
+    all_monthly_dfs = {}
+    for year in years_with_monthly_breakdowns():
+        if year in monthly_dfs:
+            all_monthly_dfs[year] = monthly_dfs[year]
+        else:
+            all_monthly_dfs[year] = analyse_budget.import_csv_to_df(analyse_budget.OUTPUTFILESSTORE + 'monthly_breakdowns/', str(year) + '_monthly_breakdown')
+    analyse_budget.create_monthly_breakdown_all_years(all_monthly_dfs)
+
+    # Only now that the yearly store is up to date do the transactions go
+    # into all_data.csv and the database. If anything above goes wrong they
+    # haven't been marked as read, so they're picked up again next time
+    collect_and_classify.save_new_transactions(new_df, rematched_df, df_class)
+
+    return updated_years
+
+
+def render_years(updated_years):
+    '''
+    Re-draw the monthly plots for the updated years only. The annual plots
+    cover every year, so they always get re-drawn
+    :params: a list of years that have changed
+    :return: nothing, saves the plots
+    '''
+
+    # Only imported now, because it's only needed when drawing
+    import plot_budget
+
+    monthly_dfs = plot_budget.get_monthly_summaries(updated_years)
+    income_dfs = plot_budget.create_incomings(monthly_dfs)
+    outgoings_detail_dfs, outgoings_summary_dfs = plot_budget.rank_outgoings(monthly_dfs)
+
+    all_years_by_month_df = plot_budget.import_csv_to_df(plot_budget.MONTHLIESFILESSTORE, plot_budget.BYMONTHDATA)
+    all_years = plot_budget.what_years_in_data(all_years_by_month_df)
+    annual_summaries_dfs = plot_budget.how_costs_change_over_years(all_years_by_month_df, all_years)
+    income_outgoings_df = plot_budget.calculate_income_and_outgoings(annual_summaries_dfs['total'])
+
+    plot_budget.plot_everything(income_dfs, outgoings_detail_dfs, outgoings_summary_dfs, annual_summaries_dfs,
+                                income_outgoings_df, all_years)
+
+    return
+
+
+def update_forecast():
+    '''
+    Re-do the month end forecast with the new transactions. Not done with
+    forecast_budget.main, because that writes (and clears) the stage records
+    before the watch report gets them
+    :params: nothing
+    :return: nothing, saves the forecasts
+    '''
+
+    import forecast_budget
+
+    history_df = forecast_budget.load_history()
+    classification_forecast_df, account_forecast_df = forecast_budget.forecast_month_end(history_df)
+    forecast_budget.save_forecasts(classification_forecast_df, account_forecast_df)
+
+    return
+
+
+def process_batch(filenames, render=True):
+    '''
+    Ingest a batch of new statements, archive them and re-draw what changed
+    :params: a list of statement filenames and whether to draw the plots
+    :return: a list of the years that were updated
+    '''
+
+    updated_years = ingest_statements(filenames)
+
+    # Everything's safely in the store, so the statements can be archived
+    for file in filenames:
+        os.rename(collect_and_classify.UNPROCESSED_STATEMENTS + file, collect_and_classify.ARCHIVED_STATEMENTS + file)
+
+    if render and len(updated_years) > 0:
+        render_years(updated_years)
+
+    # New transactions change what's still to come this month. The batch has
+    # been archived by now, so a forecast that fails mustn't fail the batch
+    if len(updated_years) > 0:
+        try:
+            update_forecast()
+        except Exception as error:
+            print('Failed to update the forecast: ' + str(error))
+
+    # Save timings etc. if instrumentation has been switched on
+    write_report('watch')
+
+    return updated_years
+
+
+def watch(poll_seconds=POLL_SECONDS, debounce_seconds=DEBOUNCE_SECONDS, render=True):
+    '''
+    Keep watching the unprocessed statements dir and process new statements
+    as they arrive. Nothing is processed until the dir has been quiet for
+    debounce_seconds, so a burst of files gets processed as one batch (and a
+    file that's still being copied in doesn't get read half-written)
+    :params: how often to look for files, how long to wait for things to
+             settle down, and whether to draw the plots
+    :return: nothing, runs until interrupted
+    '''
+
+    # I write back to the original dataframe and pandas warns about that, so turning off the warning
+    pd.options.mode.chained_assignment = None
+
+    pending = {}
+    last_change = None
+    # Statements that broke the pipeline. They're skipped until they change,
+    # otherwise we'd try (and fail) to process them every debounce period
+    failed = {}
+
+    print('Watching ' + collect_and_classify.UNPROCESSED_STATEMENTS + ' for new statements')
+    try:
+        while True:
+            current = snapshot_statements()
+            current = {file: stats for file, stats in current.items() if failed.get(file) != stats}
+
+            if current != pending:
+                pending = current
+                last_change = time.time()
+
+            if len(pending) > 0 and time.time() - last_change >= debounce_seconds:
+                filenames = sorted(pending)
+                print('Processing ' + ', '.join(filenames))
+                try:
+                    updated_years = process_batch(filenames, render)
+                    print('Updated ' + ', '.join(str(year) for year in updated_years))
+                except Exception as error:
+                    print('Failed to process ' + ', '.join(filenames) + ': ' + str(error))
+                    failed.update(pending)
+                pending = {}
+
+            time.sleep(poll_seconds)
+    except KeyboardInterrupt:
+        print('Stopped watching')
+
+    return
+
+
+def main():
+    """
+    Main function to run program
+    """
+    watch()
+
+if __name__ == '__main__':
+    main()